@@ -0,0 +1,33 @@
+"""add partial index for math duel expiry
+
+Revision ID: 008
+Revises: 007
+Create Date: 2026-10-17
+
+Частичный индекс по expires_at для активных дуэлей: expire_old_duels
+обновляет истекшие дуэли одним UPDATE без полного прохода по таблице.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '008'
+down_revision: Union[str, None] = '007'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        'ix_math_duels_active_expires_at',
+        'math_duels',
+        ['expires_at'],
+        postgresql_where=sa.text('is_active'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_math_duels_active_expires_at', table_name='math_duels')
@@ -0,0 +1,30 @@
+"""add reminder send attempts
+
+Revision ID: 009
+Revises: 008
+Create Date: 2026-10-17
+
+Счётчик неудачных отправок напоминания: после REMINDER_MAX_ATTEMPTS
+планировщик перестаёт его повторять.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '009'
+down_revision: Union[str, None] = '008'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('reminders',
+        sa.Column('send_attempts', sa.Integer(), nullable=False, server_default='0')
+    )
+
+
+def downgrade() -> None:
+    op.drop_column('reminders', 'send_attempts')
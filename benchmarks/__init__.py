@@ -0,0 +1,10 @@
+"""
+Бенчмарки горячих путей бота.
+
+Запускаются вручную против настоящих Redis/Postgres из config
+(REDIS_URL, DATABASE_URL), например:
+
+    python -m benchmarks.members_random
+
+Пишут во временные ключи/чаты с отрицательными id и удаляют их за собой.
+"""
@@ -0,0 +1,106 @@
+"""
+Старый и новый путь ChatRepository.get_or_create под конкурентной нагрузкой.
+
+- old — SELECT, затем INSERT + commit + refresh (как до upsert);
+  параллельные апдейты нового чата ловят IntegrityError на chat_id;
+- new — INSERT ... ON CONFLICT DO UPDATE ... WHERE ... RETURNING
+  (+ SELECT, если строка не изменилась).
+
+Сценарии: first — concurrency задач одновременно создают одни и те же
+новые чаты; repeat — те же чаты запрашиваются снова (промах L1-кэша).
+Процессный кэш чатов отключён, инвалидации в Redis не рассылаются.
+
+    python -m benchmarks.chat_upsert [--chats 200] [--concurrency 20]
+"""
+
+import argparse
+import asyncio
+import time
+from typing import Optional
+
+from sqlalchemy import delete, select
+from sqlalchemy.exc import IntegrityError
+
+from cache.chat_local import chat_cache
+from database.engine import async_session, engine
+from database.models import Chat
+from database.repositories import ChatRepository
+
+# Временные чаты бенчмарка: chat_id от BENCH_CHAT_BASE вниз
+BENCH_CHAT_BASE = -900_007_000_000
+
+
+async def old_get_or_create(chat_id: int, title: Optional[str]) -> None:
+    """Путь до upsert: SELECT, потом INSERT/UPDATE с commit и refresh."""
+    async with async_session() as session:
+        result = await session.execute(select(Chat).where(Chat.chat_id == chat_id))
+        chat = result.scalar_one_or_none()
+        
+        if chat is None:
+            chat = Chat(chat_id=chat_id, title=title)
+            session.add(chat)
+            await session.commit()
+            await session.refresh(chat)
+        elif title and chat.title != title:
+            chat.title = title
+            await session.commit()
+
+
+async def new_get_or_create(chat_id: int, title: Optional[str]) -> None:
+    async with async_session() as session:
+        await ChatRepository(session).get_or_create(chat_id, title)
+
+
+async def run_scenario(method, chat_ids: list[int], concurrency: int) -> tuple[float, int]:
+    """Каждый чат запрашивают concurrency задач одновременно. Возвращает (секунды, ошибки)."""
+    errors = 0
+    
+    async def call(chat_id: int) -> None:
+        nonlocal errors
+        try:
+            await method(chat_id, f"bench {chat_id}")
+        except IntegrityError:
+            errors += 1
+    
+    started = time.perf_counter()
+    for chat_id in chat_ids:
+        await asyncio.gather(*(call(chat_id) for _ in range(concurrency)))
+    return time.perf_counter() - started, errors
+
+
+async def cleanup() -> None:
+    async with async_session() as session:
+        await session.execute(delete(Chat).where(Chat.chat_id <= BENCH_CHAT_BASE))
+        await session.commit()
+
+
+async def _no_invalidate(chat_id: int) -> None:
+    pass
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--chats", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    args = parser.parse_args()
+    
+    # Каждый вызов — промах кэша, без рассылки в Redis
+    chat_cache.max_size = 0
+    chat_cache.invalidate = _no_invalidate
+    
+    calls = args.chats * args.concurrency
+    print(f"{'path':>4} {'scenario':>8} {'total s':>8} {'us/call':>8} {'errors':>7}")
+    try:
+        for name, method in (("old", old_get_or_create), ("new", new_get_or_create)):
+            await cleanup()
+            chat_ids = [BENCH_CHAT_BASE - i for i in range(args.chats)]
+            for scenario in ("first", "repeat"):
+                elapsed, errors = await run_scenario(method, chat_ids, args.concurrency)
+                print(f"{name:>4} {scenario:>8} {elapsed:>8.2f} {elapsed / calls * 1e6:>8.0f} {errors:>7}")
+    finally:
+        await cleanup()
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
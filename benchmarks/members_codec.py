@@ -0,0 +1,66 @@
+"""
+Размер записи и скорость кодеков кэша участников (cache/codecs.py).
+
+Для каждого кодека считает средний размер записи в байтах (UTF-8, как
+её хранит Redis) и скорость кодирования/декодирования. Redis не нужен.
+
+    python -m benchmarks.members_codec [--members 100000]
+"""
+
+import argparse
+import random
+import time
+from dataclasses import asdict
+
+from cache.chat_members import CachedMember
+from cache.codecs import CODECS, decode_member
+
+FIRST_NAMES = ["Иван", "Пётр", "Анна", "Мария", "Alex", "John", "Ёжик", "Дмитрий"]
+LAST_NAMES = ["Петров", "Сидорова", "Smith", None, "Кузнецов", None]
+
+
+def make_members(count: int) -> list[dict]:
+    """Участники, похожие на настоящих (часть без фамилии и username)."""
+    rng = random.Random(5)
+    members = []
+    for user_id in range(count):
+        first_name = rng.choice(FIRST_NAMES)
+        last_name = rng.choice(LAST_NAMES)
+        member = CachedMember(
+            user_id=rng.randint(10**8, 8 * 10**9),
+            username=f"user_{user_id}" if rng.random() < 0.8 else None,
+            full_name=f"{first_name} {last_name}" if last_name else first_name,
+            first_name=first_name,
+            last_name=last_name,
+        )
+        members.append(asdict(member))
+    return members
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--members", type=int, default=100_000)
+    args = parser.parse_args()
+    
+    members = make_members(args.members)
+    print(f"{'codec':>8} {'bytes/member':>13} {'encode/s':>11} {'decode/s':>11}")
+    
+    for name, codec in CODECS.items():
+        started = time.perf_counter()
+        encoded = [codec.encode(fields) for fields in members]
+        encode_time = time.perf_counter() - started
+        
+        started = time.perf_counter()
+        decoded = [decode_member(data) for data in encoded]
+        decode_time = time.perf_counter() - started
+        assert decoded == members, f"{name}: round trip mismatch"
+        
+        size = sum(len(data.encode()) for data in encoded) / len(encoded)
+        print(
+            f"{name:>8} {size:>13.1f} {len(members) / encode_time:>11.0f} "
+            f"{len(members) / decode_time:>11.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
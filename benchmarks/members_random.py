@@ -0,0 +1,108 @@
+"""
+Латентность выбора случайного участника (!кто) для чатов разного размера.
+
+Сравнивает:
+- hgetall — старый путь: HGETALL всего хэша + random.choice;
+- hkeys — запасной путь для Redis < 6.2: HKEYS + HGET одного поля;
+- hrandfield — HRANDFIELD key 1 WITHVALUES (ChatMembersCache.get_random_member).
+
+    python -m benchmarks.members_random [--sizes 10 1000 100000] [--runs 200]
+"""
+
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+from cache.chat_members import CachedMember, ChatMembersCache
+from cache.redis_client import redis_client
+
+# Временный чат бенчмарка
+BENCH_CHAT_ID = -900_000_003
+
+
+async def fill(chat_id: int, size: int) -> None:
+    """Заполнить хэш участников size записями."""
+    key = ChatMembersCache._key(chat_id)
+    await redis_client.delete(key)
+    
+    batch: dict[str, str] = {}
+    for user_id in range(1, size + 1):
+        member = CachedMember(
+            user_id=user_id,
+            username=f"user{user_id}",
+            full_name=f"Имя{user_id} Фамилия{user_id}",
+            first_name=f"Имя{user_id}",
+            last_name=f"Фамилия{user_id}",
+        )
+        batch[str(user_id)] = member.encode()
+        if len(batch) >= 5000:
+            await redis_client.client.hset(key, mapping=batch)
+            batch = {}
+    if batch:
+        await redis_client.client.hset(key, mapping=batch)
+
+
+async def pick_hgetall(chat_id: int) -> CachedMember:
+    return random.choice(await ChatMembersCache.get_all_members(chat_id))
+
+
+async def pick_hkeys(chat_id: int) -> CachedMember:
+    key = ChatMembersCache._key(chat_id)
+    user_ids = await redis_client.hkeys(key)
+    return CachedMember.decode(await redis_client.hget(key, random.choice(user_ids)))
+
+
+async def pick_hrandfield(chat_id: int) -> CachedMember:
+    ChatMembersCache._hrandfield_unsupported = False
+    return await ChatMembersCache.get_random_member(chat_id)
+
+
+METHODS = {
+    "hgetall": pick_hgetall,
+    "hkeys": pick_hkeys,
+    "hrandfield": pick_hrandfield,
+}
+
+
+async def measure(method, chat_id: int, runs: int) -> list[float]:
+    """Время одного вызова в миллисекундах, runs раз."""
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        await method(chat_id)
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+async def run(sizes: list[int], runs: int) -> None:
+    print(f"{'members':>8} {'method':>11} {'p50 ms':>9} {'p95 ms':>9}")
+    try:
+        for size in sizes:
+            await fill(BENCH_CHAT_ID, size)
+            # Для больших чатов HGETALL слишком медленный — меньше прогонов
+            method_runs = max(5, runs * 1000 // max(size, 1000))
+            for name, method in METHODS.items():
+                timings = await measure(method, BENCH_CHAT_ID, runs if name == "hrandfield" else method_runs)
+                p95 = statistics.quantiles(timings, n=20)[-1] if len(timings) > 1 else timings[0]
+                print(f"{size:>8} {name:>11} {statistics.median(timings):>9.3f} {p95:>9.3f}")
+    finally:
+        await redis_client.delete(ChatMembersCache._key(BENCH_CHAT_ID))
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 1000, 100_000])
+    parser.add_argument("--runs", type=int, default=200)
+    args = parser.parse_args()
+    
+    await redis_client.connect()
+    try:
+        await run(args.sizes, args.runs)
+    finally:
+        await redis_client.disconnect()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
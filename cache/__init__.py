@@ -1,5 +1,12 @@
 from .redis_client import redis_client, RedisCache
-from .chat_members import ChatMembersCache
-
-__all__ = ["redis_client", "RedisCache", "ChatMembersCache"]
+from .chat_members import ChatMembersCache, MembersSummary
+from .chat_local import ChatLocalCache, chat_cache
+from .duel_index import ActiveDuel, ActiveDuelIndex, duel_index
+from .quote_renders import QuoteRenderCache, quote_render_cache
+from .sheet_state import SheetFetchState, SheetStateCache, sheet_state_cache
 
+__all__ = [
+    "redis_client", "RedisCache", "ChatMembersCache", "MembersSummary", "ChatLocalCache", "chat_cache",
+    "ActiveDuel", "ActiveDuelIndex", "duel_index", "QuoteRenderCache", "quote_render_cache",
+    "SheetFetchState", "SheetStateCache", "sheet_state_cache",
+]
@@ -0,0 +1,141 @@
+"""
+Процессный (L1) кэш чатов.
+
+Почти каждый апдейт начинается с ChatRepository.get_or_create или
+get_by_chat_id, хотя строки chats почти не меняются. Кэш хранит
+PK, тип и название чата по Telegram chat_id с TTL и LRU-вытеснением.
+
+Изменения чата инвалидируют запись локально и рассылаются остальным
+процессам бота через Redis pub/sub.
+"""
+
+import asyncio
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional, TYPE_CHECKING
+
+from config import CHAT_CACHE_TTL, CHAT_CACHE_SIZE
+from .redis_client import redis_client
+
+if TYPE_CHECKING:
+    from database.models import Chat
+
+logger = logging.getLogger(__name__)
+
+# Канал для рассылки инвалидаций между процессами
+INVALIDATION_CHANNEL = "chats:invalidate"
+
+
+@dataclass(frozen=True)
+class CachedChat:
+    """
+    Снимок строки chats, нужный хендлерам.
+    
+    Его возвращают ChatRepository.get_or_create и get_by_chat_id;
+    репозитории принимают его вместо Chat (им нужны только id и chat_id).
+    """
+    id: int
+    chat_id: int
+    title: Optional[str]
+    chat_type: str
+    
+    @classmethod
+    def from_chat(cls, chat: "Chat") -> "CachedChat":
+        return cls(id=chat.id, chat_id=chat.chat_id, title=chat.title, chat_type=chat.chat_type)
+
+
+class ChatLocalCache:
+    """TTL/LRU кэш чатов по Telegram chat_id."""
+    
+    def __init__(self, ttl: float = CHAT_CACHE_TTL, max_size: int = CHAT_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries: OrderedDict[int, tuple[float, CachedChat]] = OrderedDict()
+        # Чтобы не обрабатывать собственные сообщения из pub/sub
+        self._instance_id = uuid.uuid4().hex
+        self._task: Optional[asyncio.Task] = None
+    
+    def get(self, chat_id: int) -> Optional[CachedChat]:
+        """Получить чат из кэша (None — промах или запись устарела)."""
+        item = self._entries.get(chat_id)
+        if item is None:
+            return None
+        
+        expires_at, cached = item
+        if expires_at <= time.monotonic():
+            del self._entries[chat_id]
+            return None
+        
+        self._entries.move_to_end(chat_id)
+        return cached
+    
+    def put(self, chat: "Chat") -> CachedChat:
+        """Положить чат в кэш, вернуть снимок."""
+        cached = CachedChat.from_chat(chat)
+        self._entries[chat.chat_id] = (time.monotonic() + self.ttl, cached)
+        self._entries.move_to_end(chat.chat_id)
+        
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+        return cached
+    
+    def evict(self, chat_id: int) -> None:
+        """Удалить запись только в этом процессе."""
+        self._entries.pop(chat_id, None)
+    
+    def clear(self) -> None:
+        self._entries.clear()
+    
+    async def invalidate(self, chat_id: int) -> None:
+        """Удалить запись здесь и во всех остальных процессах."""
+        self.evict(chat_id)
+        try:
+            await redis_client.client.publish(INVALIDATION_CHANNEL, f"{self._instance_id}:{chat_id}")
+        except Exception as e:
+            # Остальные процессы догонят по TTL
+            logger.warning(f"Failed to publish chat invalidation for {chat_id}: {e}")
+    
+    async def _listen(self) -> None:
+        """Слушать инвалидации от других процессов."""
+        while True:
+            pubsub = redis_client.client.pubsub()
+            try:
+                await pubsub.subscribe(INVALIDATION_CHANNEL)
+                async for message in pubsub.listen():
+                    if message["type"] != "message":
+                        continue
+                    
+                    sender, _, chat_id = message["data"].partition(":")
+                    if sender != self._instance_id:
+                        self.evict(int(chat_id))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Chat invalidation listener error: {e}")
+                # Пока не были подписаны, могли пропустить инвалидации
+                self.clear()
+                await asyncio.sleep(5)
+            finally:
+                await pubsub.close()
+    
+    async def start(self) -> None:
+        """Подписаться на инвалидации (Redis должен быть подключён)."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._listen())
+    
+    async def stop(self) -> None:
+        """Отписаться от инвалидаций."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+# Глобальный инстанс
+chat_cache = ChatLocalCache()
@@ -1,9 +1,16 @@
 import json
 import logging
 import random
-from dataclasses import dataclass, asdict
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, asdict, field
+from datetime import datetime, timezone
 from typing import Optional
 
+from redis.exceptions import ResponseError
+
+from config import MEMBERS_CACHE_CODEC
+from .codecs import decode_member, get_codec
 from .redis_client import redis_client
 
 logger = logging.getLogger(__name__)
@@ -11,6 +18,32 @@ logger = logging.getLogger(__name__)
 # TTL для кэша участников чата - 24 часа
 MEMBERS_CACHE_TTL = 60 * 60 * 24
 
+# Как часто продлевать TTL хэша участников (не на каждое сообщение)
+MEMBERS_TTL_REFRESH_INTERVAL = 60 * 10
+
+# Сколько чатов максимум помнить в _ttl_refreshed_at
+MEMBERS_TTL_TRACKED_CHATS = 10000
+
+# Кодек, которым пишутся новые записи (читаются все поддерживаемые)
+members_codec = get_codec(MEMBERS_CACHE_CODEC)
+
+# Каким кодеком уже перекодированы все хэши (миграция при старте — один раз)
+MEMBERS_CODEC_MIGRATED_KEY = "members:codec_migrated"
+
+# KEYS[1] — хэш участников; ARGV: тройки field, старое значение, новое.
+# Перезаписываем поле, только если оно не изменилось с момента чтения:
+# иначе затрём профиль, который add_member записал между HSCAN и записью.
+REPLACE_IF_UNCHANGED_SCRIPT = """
+local replaced = 0
+for i = 1, #ARGV, 3 do
+    if redis.call('HGET', KEYS[1], ARGV[i]) == ARGV[i + 1] then
+        redis.call('HSET', KEYS[1], ARGV[i], ARGV[i + 2])
+        replaced = replaced + 1
+    end
+end
+return replaced
+"""
+
 
 @dataclass
 class CachedMember:
@@ -27,16 +60,50 @@ class CachedMember:
     @classmethod
     def from_json(cls, data: str) -> "CachedMember":
         return cls(**json.loads(data))
+    
+    def encode(self) -> str:
+        """Закодировать для хранения в Redis текущим кодеком."""
+        return members_codec.encode(asdict(self))
+    
+    @classmethod
+    def decode(cls, data: str) -> "CachedMember":
+        """Декодировать запись в любом поддерживаемом формате."""
+        return cls(**decode_member(data))
+
+
+@dataclass
+class MembersSummary:
+    """Краткая сводка по участникам чата без выгрузки всего хэша."""
+    count: int
+    last_activity: Optional[datetime]  # UTC
+    top: list[tuple[CachedMember, int]] = field(default_factory=list)  # (участник, сообщений)
 
 
 class ChatMembersCache:
     """Кэш участников чата в Redis."""
     
+    # Когда (time.monotonic) этот процесс последний раз продлевал TTL ключа;
+    # упорядочено по времени, старые записи вытесняются
+    _ttl_refreshed_at: OrderedDict[str, float] = OrderedDict()
+    
+    # Сервер не знает HRANDFIELD (Redis < 6.2) — используем запасной путь
+    _hrandfield_unsupported: bool = False
+    
     @staticmethod
     def _key(chat_id: int) -> str:
         """Ключ для хэша участников конкретного чата."""
         return f"chat:{chat_id}:members"
     
+    @staticmethod
+    def _activity_key(chat_id: int) -> str:
+        """Ключ ZSET со счётчиками сообщений участников."""
+        return f"chat:{chat_id}:activity"
+    
+    @staticmethod
+    def _last_activity_key(chat_id: int) -> str:
+        """Ключ с временем последнего сообщения в чате (unix time)."""
+        return f"chat:{chat_id}:last_activity"
+    
     @classmethod
     async def add_member(
         cls,
@@ -57,8 +124,36 @@ class ChatMembersCache:
         )
         
         key = cls._key(chat_id)
-        await redis_client.hset(key, str(user_id), member.to_json())
-        await redis_client.expire(key, MEMBERS_CACHE_TTL)
+        activity_key = cls._activity_key(chat_id)
+        last_activity_key = cls._last_activity_key(chat_id)
+        now = time.monotonic()
+        refresh_ttl = now - cls._ttl_refreshed_at.get(key, 0.0) >= MEMBERS_TTL_REFRESH_INTERVAL
+        
+        # Все команды уходят одним round-trip
+        async with redis_client.pipeline() as pipe:
+            pipe.hset(key, str(user_id), member.encode())
+            pipe.zincrby(activity_key, 1, str(user_id))
+            pipe.set(last_activity_key, str(time.time()), ex=MEMBERS_CACHE_TTL)
+            if refresh_ttl:
+                pipe.expire(key, MEMBERS_CACHE_TTL)
+                pipe.expire(activity_key, MEMBERS_CACHE_TTL)
+        
+        if refresh_ttl:
+            cls._remember_ttl_refresh(key, now)
+    
+    @classmethod
+    def _remember_ttl_refresh(cls, key: str, now: float) -> None:
+        """Запомнить продление TTL и вытеснить устаревшие записи."""
+        refreshed = cls._ttl_refreshed_at
+        refreshed[key] = now
+        refreshed.move_to_end(key)
+        
+        # Запись старше интервала всё равно не мешает продлению
+        while refreshed and (
+            len(refreshed) > MEMBERS_TTL_TRACKED_CHATS
+            or now - next(iter(refreshed.values())) >= MEMBERS_TTL_REFRESH_INTERVAL
+        ):
+            refreshed.popitem(last=False)
     
     @classmethod
     async def get_member(cls, chat_id: int, user_id: int) -> Optional[CachedMember]:
@@ -66,7 +161,7 @@ class ChatMembersCache:
         key = cls._key(chat_id)
         data = await redis_client.hget(key, str(user_id))
         if data:
-            return CachedMember.from_json(data)
+            return CachedMember.decode(data)
         return None
     
     @classmethod
@@ -78,7 +173,7 @@ class ChatMembersCache:
         members = []
         for member_data in data.values():
             try:
-                members.append(CachedMember.from_json(member_data))
+                members.append(CachedMember.decode(member_data))
             except Exception as e:
                 logger.warning(f"Failed to parse member data: {e}")
         
@@ -87,21 +182,147 @@ class ChatMembersCache:
     @classmethod
     async def get_random_member(cls, chat_id: int) -> Optional[CachedMember]:
         """Получить случайного участника чата."""
-        members = await cls.get_all_members(chat_id)
-        if members:
-            return random.choice(members)
+        key = cls._key(chat_id)
+        
+        if not cls._hrandfield_unsupported:
+            try:
+                # Одно случайное поле вместе со значением — без HGETALL всего хэша
+                data = await redis_client.hrandfield(key, 1, withvalues=True)
+            except ResponseError as e:
+                # Запасной путь только для старого сервера; WRONGTYPE и прочее — наверх
+                if "unknown command" not in str(e).lower():
+                    raise
+                logger.warning(f"HRANDFIELD is not supported, falling back to HKEYS: {e}")
+                cls._hrandfield_unsupported = True
+            else:
+                if not data:
+                    return None
+                return CachedMember.decode(data[1])
+        
+        # Старый Redis: выбираем случайный ключ и декодируем только его
+        user_ids = await redis_client.hkeys(key)
+        if not user_ids:
+            return None
+        data = await redis_client.hget(key, random.choice(user_ids))
+        if data:
+            return CachedMember.decode(data)
         return None
     
     @classmethod
     async def get_member_count(cls, chat_id: int) -> int:
         """Получить количество участников в кэше."""
+        return await redis_client.hlen(cls._key(chat_id))
+    
+    @classmethod
+    async def get_member_counts(cls, chat_ids: list[int]) -> dict[int, int]:
+        """Количество участников в кэше для нескольких чатов за один round-trip."""
+        if not chat_ids:
+            return {}
+        
+        async with redis_client.pipeline() as pipe:
+            for chat_id in chat_ids:
+                pipe.hlen(cls._key(chat_id))
+        return dict(zip(chat_ids, pipe.results))
+    
+    @classmethod
+    async def get_summary(cls, chat_id: int, top_k: int = 5) -> MembersSummary:
+        """
+        Сводка по чату: количество участников, время последней активности
+        и top_k самых активных. Передаёт O(top_k) данных вместо всего хэша.
+        """
         key = cls._key(chat_id)
-        data = await redis_client.hgetall(key)
-        return len(data)
+        
+        async with redis_client.pipeline() as pipe:
+            pipe.hlen(key)
+            pipe.get(cls._last_activity_key(chat_id))
+            if top_k > 0:
+                pipe.zrevrange(cls._activity_key(chat_id), 0, top_k - 1, withscores=True)
+        count, last_ts, *rest = pipe.results
+        top_scores = rest[0] if rest else []
+        
+        last_activity = None
+        if last_ts:
+            last_activity = datetime.fromtimestamp(float(last_ts), tz=timezone.utc)
+        
+        top = []
+        if top_scores:
+            user_ids = [user_id for user_id, _ in top_scores]
+            members_data = await redis_client.hmget(key, user_ids)
+            for (_, score), data in zip(top_scores, members_data):
+                if not data:
+                    continue
+                try:
+                    top.append((CachedMember.decode(data), int(score)))
+                except Exception as e:
+                    logger.warning(f"Failed to parse member data: {e}")
+        
+        return MembersSummary(count=count, last_activity=last_activity, top=top)
+    
+    @classmethod
+    async def migrate_encoding(cls, chat_id: int, batch_size: int = 500) -> int:
+        """
+        Перекодировать записи чата текущим кодеком.
+        
+        Активные участники перекодируются и так при следующем сообщении,
+        а неактивные чаты уходят по TTL — миграция лишь ускоряет процесс.
+        Запись заменяется, только если она не изменилась после чтения.
+        Возвращает количество перезаписанных записей.
+        """
+        key = cls._key(chat_id)
+        script = redis_client.client.register_script(REPLACE_IF_UNCHANGED_SCRIPT)
+        args: list[str] = []
+        migrated = 0
+        
+        async for user_id, data in redis_client.hscan_iter(key, count=batch_size):
+            try:
+                encoded = CachedMember.decode(data).encode()
+            except Exception as e:
+                logger.warning(f"Failed to parse member data: {e}")
+                continue
+            if encoded != data:
+                args.extend((user_id, data, encoded))
+            
+            if len(args) >= batch_size * 3:
+                migrated += await script(keys=[key], args=args)
+                args = []
+        
+        if args:
+            migrated += await script(keys=[key], args=args)
+        
+        return migrated
+    
+    @classmethod
+    async def migrate_all_encodings(cls) -> int:
+        """
+        Перекодировать записи во всех чатах.
+        
+        Выполняется один раз на кодек: после полного прохода в Redis
+        остаётся маркер, и следующие запуски бота ничего не сканируют.
+        """
+        if await redis_client.get(MEMBERS_CODEC_MIGRATED_KEY) == members_codec.name:
+            return 0
+        
+        total = 0
+        async for key in redis_client.scan_iter(match=cls._key("*")):
+            try:
+                chat_id = int(key.split(":")[1])
+            except (IndexError, ValueError):
+                continue
+            total += await cls.migrate_encoding(chat_id)
+        
+        # Новые записи и так пишутся текущим кодеком
+        await redis_client.set(MEMBERS_CODEC_MIGRATED_KEY, members_codec.name)
+        logger.info(f"Re-encoded {total} cached members with '{members_codec.name}' codec")
+        return total
     
     @classmethod
     async def remove_member(cls, chat_id: int, user_id: int) -> None:
         """Удалить участника из кэша."""
         key = cls._key(chat_id)
-        await redis_client.hdel(key, str(user_id))
+        async with redis_client.pipeline() as pipe:
+            pipe.hdel(key, str(user_id))
+            pipe.zrem(cls._activity_key(chat_id), str(user_id))
+        # Если это был последний участник, ключ удалён вместе с TTL —
+        # при следующем add_member TTL нужно выставить заново
+        cls._ttl_refreshed_at.pop(key, None)
 
@@ -0,0 +1,128 @@
+"""
+Кодеки для значений в хэшах участников чата.
+
+Каждая запись — поля CachedMember. Формат определяется по первому символу:
+- '{' — исходный JSON (старые записи, без префикса);
+- '\x01' — компактный формат v1: поля через '\x1f', None как пустое
+  значение с маркером '\x00', full_name опускается, если он совпадает
+  с "first_name last_name" (так его строит Telegram).
+
+Клиент Redis работает с decode_responses=True, поэтому все форматы
+остаются валидным UTF-8 текстом.
+"""
+
+import json
+from abc import ABC, abstractmethod
+from typing import Any, Optional
+
+# Порядок полей CachedMember в компактном формате
+MEMBER_FIELDS = ("user_id", "username", "full_name", "first_name", "last_name")
+
+
+class MemberCodec(ABC):
+    """Базовый кодек для записи участника."""
+    
+    # Префикс версии формата (пусто — без префикса)
+    prefix: str = ""
+    name: str = ""
+    
+    @abstractmethod
+    def encode(self, fields: dict[str, Any]) -> str:
+        """Закодировать поля CachedMember."""
+    
+    @abstractmethod
+    def decode(self, data: str) -> dict[str, Any]:
+        """Декодировать запись в поля CachedMember."""
+
+
+class JsonMemberCodec(MemberCodec):
+    """Исходный JSON формат."""
+    
+    name = "json"
+    
+    def encode(self, fields: dict[str, Any]) -> str:
+        return json.dumps(fields, ensure_ascii=False)
+    
+    def decode(self, data: str) -> dict[str, Any]:
+        return json.loads(data)
+
+
+class CompactMemberCodec(MemberCodec):
+    """Компактный формат v1 (см. описание модуля)."""
+    
+    prefix = "\x01"
+    name = "compact"
+    
+    SEP = "\x1f"
+    NONE = "\x00"
+    
+    def encode(self, fields: dict[str, Any]) -> str:
+        values: list[Optional[str]] = [
+            str(fields["user_id"]),
+            fields["username"],
+            fields["full_name"],
+            fields["first_name"],
+            fields["last_name"],
+        ]
+        
+        # Служебные символы внутри имени — такую запись оставляем в JSON
+        for value in values:
+            if value and (self.SEP in value or self.NONE in value):
+                return _json_codec.encode(fields)
+        
+        if fields["full_name"] == _derive_full_name(fields["first_name"], fields["last_name"]):
+            values[2] = ""
+        
+        return self.prefix + self.SEP.join(self.NONE if v is None else v for v in values)
+    
+    def decode(self, data: str) -> dict[str, Any]:
+        parts = [None if v == self.NONE else v for v in data[len(self.prefix):].split(self.SEP)]
+        if len(parts) != len(MEMBER_FIELDS):
+            raise ValueError(f"Malformed compact member entry: {len(parts)} fields")
+        
+        fields = dict(zip(MEMBER_FIELDS, parts))
+        fields["user_id"] = int(fields["user_id"])
+        if not fields["full_name"]:
+            fields["full_name"] = _derive_full_name(fields["first_name"], fields["last_name"])
+        return fields
+
+
+def _derive_full_name(first_name: Optional[str], last_name: Optional[str]) -> str:
+    """full_name так, как его собирает aiogram."""
+    if last_name:
+        return f"{first_name} {last_name}"
+    return first_name or ""
+
+
+_json_codec = JsonMemberCodec()
+_compact_codec = CompactMemberCodec()
+
+CODECS: dict[str, MemberCodec] = {
+    _json_codec.name: _json_codec,
+    _compact_codec.name: _compact_codec,
+}
+
+# Декодеры по префиксу версии
+_DECODERS: dict[str, MemberCodec] = {
+    _compact_codec.prefix: _compact_codec,
+}
+
+
+def get_codec(name: str) -> MemberCodec:
+    """Получить кодек по имени (json, compact)."""
+    try:
+        return CODECS[name]
+    except KeyError:
+        raise ValueError(f"Unknown member codec: {name}") from None
+
+
+def decode_member(data: str) -> dict[str, Any]:
+    """Декодировать запись в любом из поддерживаемых форматов."""
+    if data.startswith("{"):
+        return _json_codec.decode(data)
+    
+    codec = _DECODERS.get(data[:1])
+    if codec is None:
+        raise ValueError(f"Unknown member entry format: {data[:1]!r}")
+    return codec.decode(data)
+
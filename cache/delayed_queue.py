@@ -0,0 +1,120 @@
+"""
+Отложенная очередь задач на Redis sorted set.
+
+Score — unix time, когда задача должна выполниться. Забрать наступившие
+задачи может только один процесс: выборка и удаление из ZSET делаются
+атомарно в Lua-скрипте. Забранная задача помечается ключом с TTL, чтобы
+повторное наполнение очереди из БД не вернуло её, пока она выполняется.
+Пока задачи выполняются, метка продлевается (keep_claimed), так что долгая
+отправка не приводит к повторному выполнению на другой реплике.
+"""
+
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Iterable, Optional
+
+from .redis_client import redis_client
+
+logger = logging.getLogger(__name__)
+
+# KEYS[1] — очередь; ARGV: now, limit, claim_ttl, claim_prefix
+CLAIM_SCRIPT = """
+local ids = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+for _, id in ipairs(ids) do
+    redis.call('ZREM', KEYS[1], id)
+    redis.call('SET', ARGV[4] .. id, '1', 'EX', ARGV[3])
+end
+return ids
+"""
+
+# KEYS[1] — очередь; ARGV: claim_prefix, затем пары score, id
+ADD_UNCLAIMED_SCRIPT = """
+local added = 0
+for i = 2, #ARGV, 2 do
+    if redis.call('EXISTS', ARGV[1] .. ARGV[i + 1]) == 0 then
+        added = added + redis.call('ZADD', KEYS[1], 'NX', ARGV[i], ARGV[i + 1])
+    end
+end
+return added
+"""
+
+
+class DelayedQueue:
+    """Отложенная очередь с атомарным claim."""
+    
+    def __init__(self, name: str, claim_ttl: int = 300):
+        self.key = f"queue:{name}"
+        self.claim_prefix = f"queue:{name}:claimed:"
+        self.claim_ttl = claim_ttl
+    
+    async def schedule(self, job_id: int | str, due_at: float) -> None:
+        """Поставить (или перенести) задачу на время due_at."""
+        await redis_client.client.zadd(self.key, {str(job_id): due_at})
+    
+    async def add_unclaimed(self, jobs: Iterable[tuple[float, int | str]], batch_size: int = 500) -> int:
+        """
+        Добавить задачи, которых ещё нет в очереди и которые сейчас никем
+        не выполняются. Используется для наполнения очереди из БД.
+        """
+        script = redis_client.client.register_script(ADD_UNCLAIMED_SCRIPT)
+        added = 0
+        args: list = []
+        
+        for due_at, job_id in jobs:
+            args.extend((due_at, str(job_id)))
+            if len(args) >= batch_size * 2:
+                added += await script(keys=[self.key], args=[self.claim_prefix, *args])
+                args = []
+        
+        if args:
+            added += await script(keys=[self.key], args=[self.claim_prefix, *args])
+        return added
+    
+    async def claim_due(self, now: float, limit: int = 100) -> list[str]:
+        """Атомарно забрать до limit наступивших задач."""
+        script = redis_client.client.register_script(CLAIM_SCRIPT)
+        return await script(keys=[self.key], args=[now, limit, self.claim_ttl, self.claim_prefix])
+    
+    async def extend_claims(self, job_ids: Iterable[int | str]) -> None:
+        """Продлить метки забранных задач ещё на claim_ttl."""
+        async with redis_client.pipeline() as pipe:
+            for job_id in job_ids:
+                pipe.set(f"{self.claim_prefix}{job_id}", "1", ex=self.claim_ttl)
+    
+    @asynccontextmanager
+    async def keep_claimed(self, job_ids: list[int | str]) -> AsyncIterator[None]:
+        """
+        Продлевать метки задач, пока выполняется блок.
+        
+        Метки обновляются каждую треть claim_ttl, поэтому задача не вернётся
+        в очередь при наполнении из БД, даже если выполнение затянулось.
+        """
+        async def heartbeat() -> None:
+            while True:
+                await asyncio.sleep(self.claim_ttl / 3)
+                try:
+                    await self.extend_claims(job_ids)
+                except Exception as e:
+                    logger.warning(f"Could not extend claims in {self.key}: {e}")
+        
+        task = asyncio.create_task(heartbeat())
+        try:
+            yield
+        finally:
+            task.cancel()
+    
+    async def next_due(self) -> Optional[float]:
+        """Время ближайшей задачи в очереди."""
+        items = await redis_client.client.zrange(self.key, 0, 0, withscores=True)
+        if items:
+            return items[0][1]
+        return None
+    
+    async def remove(self, job_id: int | str) -> None:
+        """Убрать задачу из очереди."""
+        await redis_client.client.zrem(self.key, str(job_id))
+
+
+# Очередь напоминаний (id напоминания -> время отправки)
+reminder_queue = DelayedQueue("reminders")
@@ -0,0 +1,117 @@
+"""
+Процессный индекс активных матдуэлей.
+
+check_math_answer срабатывает на любое сообщение-число в любом чате.
+Индекс по (chat_id, user_id) отвечает на него без запросов в БД, если
+дуэль известна этому процессу, и отсеивает неверные ответы.
+
+Индекс наполняется в MathDuelRepository.create, чистится в resolve,
+expire_duel и expire_old_duels и восстанавливается из БД при старте.
+Дуэли других реплик в него не попадают, поэтому при промахе хендлер
+проверяет БД (MathDuelRepository.find_active) и дополняет индекс.
+"""
+
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Iterable, Optional, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from database.models import MathDuel
+
+
+@dataclass(frozen=True)
+class ActiveDuel:
+    """Данные активной дуэли, нужные для проверки ответа."""
+    id: int
+    chat_id: int  # Telegram chat_id
+    challenger_id: int
+    opponent_id: int
+    answer: int
+    expires_at: float  # unix time
+    
+    @classmethod
+    def create(
+        cls,
+        duel_id: int,
+        chat_id: int,
+        challenger_id: int,
+        opponent_id: int,
+        answer: int,
+        expires_at: datetime,
+    ) -> "ActiveDuel":
+        return cls(
+            id=duel_id,
+            chat_id=chat_id,
+            challenger_id=challenger_id,
+            opponent_id=opponent_id,
+            answer=answer,
+            expires_at=expires_at.timestamp(),
+        )
+    
+    @classmethod
+    def from_duel(cls, duel: "MathDuel", chat_id: int) -> "ActiveDuel":
+        return cls.create(
+            duel_id=duel.id,
+            chat_id=chat_id,
+            challenger_id=duel.challenger_id,
+            opponent_id=duel.opponent_id,
+            answer=duel.answer,
+            expires_at=duel.expires_at,
+        )
+
+
+class ActiveDuelIndex:
+    """Индекс активных дуэлей по (chat_id, user_id)."""
+    
+    def __init__(self):
+        self._by_user: dict[tuple[int, int], ActiveDuel] = {}
+        self._by_id: dict[int, ActiveDuel] = {}
+    
+    def __len__(self) -> int:
+        return len(self._by_id)
+    
+    def add(self, duel: ActiveDuel) -> None:
+        self._by_id[duel.id] = duel
+        self._by_user[(duel.chat_id, duel.challenger_id)] = duel
+        self._by_user[(duel.chat_id, duel.opponent_id)] = duel
+    
+    def get(self, chat_id: int, user_id: int) -> Optional[ActiveDuel]:
+        """Активная дуэль пользователя в чате (истекшие не возвращаются)."""
+        duel = self._by_user.get((chat_id, user_id))
+        if duel is None:
+            return None
+        
+        if duel.expires_at <= time.time():
+            self.remove(duel.id)
+            return None
+        return duel
+    
+    def remove(self, duel_id: int) -> Optional[ActiveDuel]:
+        duel = self._by_id.pop(duel_id, None)
+        if duel is None:
+            return None
+        
+        for user_id in (duel.challenger_id, duel.opponent_id):
+            if self._by_user.get((duel.chat_id, user_id)) is duel:
+                del self._by_user[(duel.chat_id, user_id)]
+        return duel
+    
+    def remove_expired(self) -> list[ActiveDuel]:
+        """Убрать истекшие дуэли, вернуть их."""
+        now = time.time()
+        expired = [duel for duel in self._by_id.values() if duel.expires_at <= now]
+        for duel in expired:
+            self.remove(duel.id)
+        return expired
+    
+    def load(self, duels: Iterable[ActiveDuel]) -> None:
+        """Заменить содержимое индекса."""
+        self._by_user.clear()
+        self._by_id.clear()
+        for duel in duels:
+            self.add(duel)
+
+
+# Глобальный инстанс
+duel_index = ActiveDuelIndex()
@@ -0,0 +1,70 @@
+"""
+Кэш отрендеренных картинок цитат.
+
+Одна и та же цитата с тем же шаблоном и той же аватаркой автора даёт
+одинаковую картинку, поэтому вместо повторного рендера и загрузки
+хранится file_id, который Telegram вернул на первую отправку.
+
+Ключ — (chat_pk, версия шаблона, quote_id, аватарка). Версия шаблона —
+счётчик в Redis, который увеличивает QuoteTemplateRepository.update/delete:
+записи для старой версии просто перестают читаться и истекают по TTL.
+"""
+
+import logging
+from typing import Optional
+
+from .redis_client import redis_client
+
+logger = logging.getLogger(__name__)
+
+# TTL записей с file_id — 30 дней
+QUOTE_RENDERS_TTL = 60 * 60 * 24 * 30
+
+# Значение для цитат без аватарки
+NO_AVATAR = "-"
+
+
+class QuoteRenderCache:
+    """file_id отрендеренных цитат по версии шаблона чата."""
+    
+    @staticmethod
+    def _version_key(chat_pk: int) -> str:
+        return f"quote_template:{chat_pk}:version"
+    
+    @staticmethod
+    def _renders_key(chat_pk: int, version: str) -> str:
+        return f"quote_renders:{chat_pk}:v{version}"
+    
+    async def _version(self, chat_pk: int) -> str:
+        return await redis_client.get(self._version_key(chat_pk)) or "0"
+    
+    async def get(self, chat_pk: int, quote_id: int, avatar_key: str = NO_AVATAR) -> Optional[str]:
+        """file_id готовой картинки (None — рендерить заново)."""
+        try:
+            version = await self._version(chat_pk)
+            return await redis_client.hget(self._renders_key(chat_pk, version), f"{quote_id}:{avatar_key}")
+        except Exception as e:
+            logger.warning(f"Quote render cache read failed for chat {chat_pk}: {e}")
+            return None
+    
+    async def put(self, chat_pk: int, quote_id: int, avatar_key: str, file_id: str) -> None:
+        """Запомнить file_id отправленной картинки."""
+        try:
+            version = await self._version(chat_pk)
+            key = self._renders_key(chat_pk, version)
+            async with redis_client.pipeline() as pipe:
+                pipe.hset(key, f"{quote_id}:{avatar_key}", file_id)
+                pipe.expire(key, QUOTE_RENDERS_TTL)
+        except Exception as e:
+            logger.warning(f"Quote render cache write failed for chat {chat_pk}: {e}")
+    
+    async def invalidate(self, chat_pk: int) -> None:
+        """Шаблон чата изменился — старые картинки больше не подходят."""
+        try:
+            await redis_client.client.incr(self._version_key(chat_pk))
+        except Exception as e:
+            logger.warning(f"Could not invalidate quote renders for chat {chat_pk}: {e}")
+
+
+# Глобальный инстанс
+quote_render_cache = QuoteRenderCache()
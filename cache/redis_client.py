@@ -1,6 +1,7 @@
 import json
 import logging
-from typing import Any, Optional
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Optional
 
 import redis.asyncio as redis
 
@@ -38,6 +39,19 @@ class RedisCache:
             raise RuntimeError("Redis client is not connected. Call connect() first.")
         return self._client
     
+    @asynccontextmanager
+    async def pipeline(self, transaction: bool = False) -> AsyncIterator[redis.client.Pipeline]:
+        """
+        Пайплайн команд: всё, что поставлено в pipe внутри блока,
+        уходит в Redis одним round-trip при выходе из него.
+        
+        Результаты команд после блока доступны в pipe.results (в порядке
+        постановки). transaction=True оборачивает команды в MULTI/EXEC.
+        """
+        async with self.client.pipeline(transaction=transaction) as pipe:
+            yield pipe
+            pipe.results = await pipe.execute()
+    
     async def get(self, key: str) -> Optional[str]:
         """Получить значение по ключу."""
         return await self.client.get(key)
@@ -71,6 +85,36 @@ class RedisCache:
         """Получить все поля хэша."""
         return await self.client.hgetall(name)
     
+    async def hrandfield(self, name: str, count: int = 1, withvalues: bool = False) -> list:
+        """
+        Получить случайные поля хэша (Redis >= 6.2).
+        
+        С withvalues=True возвращает плоский список [field, value, ...].
+        """
+        return await self.client.hrandfield(name, count, withvalues) or []
+    
+    async def hkeys(self, name: str) -> list:
+        """Получить все имена полей хэша."""
+        return await self.client.hkeys(name)
+    
+    async def hlen(self, name: str) -> int:
+        """Получить количество полей хэша."""
+        return await self.client.hlen(name)
+    
+    async def hmget(self, name: str, keys: list[str]) -> list[Optional[str]]:
+        """Получить несколько полей хэша."""
+        return await self.client.hmget(name, keys)
+    
+    async def hscan_iter(self, name: str, count: Optional[int] = None) -> AsyncIterator[tuple[str, str]]:
+        """Итерироваться по полям хэша порциями (HSCAN)."""
+        async for item in self.client.hscan_iter(name, count=count):
+            yield item
+    
+    async def scan_iter(self, match: str, count: Optional[int] = None) -> AsyncIterator[str]:
+        """Итерироваться по ключам по шаблону (SCAN)."""
+        async for key in self.client.scan_iter(match=match, count=count):
+            yield key
+    
     async def hdel(self, name: str, *keys: str) -> int:
         """Удалить поля из хэша."""
         return await self.client.hdel(name, *keys)
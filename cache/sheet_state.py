@@ -0,0 +1,73 @@
+"""
+Состояние последней загрузки Google-таблицы чата.
+
+Хранит валидаторы HTTP-кэша (ETag, Last-Modified) и хэш содержимого CSV,
+чтобы синхронизация без изменений в таблице обходилась одним условным
+запросом без парсинга и записи в БД.
+"""
+
+import logging
+from dataclasses import asdict, dataclass
+from typing import Optional
+
+from .redis_client import redis_client
+
+logger = logging.getLogger(__name__)
+
+# TTL состояния — 30 дней (без него просто будет полная синхронизация)
+SHEET_STATE_TTL = 60 * 60 * 24 * 30
+
+
+@dataclass
+class SheetFetchState:
+    """Что известно о последней успешно применённой версии таблицы."""
+    url: str
+    content_hash: str
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+
+
+class SheetStateCache:
+    """Состояние загрузки таблиц по chat_pk."""
+    
+    @staticmethod
+    def _key(chat_pk: int) -> str:
+        return f"sheets:{chat_pk}:state"
+    
+    async def get(self, chat_pk: int) -> Optional[SheetFetchState]:
+        try:
+            data = await redis_client.client.hgetall(self._key(chat_pk))
+        except Exception as e:
+            logger.warning(f"Could not read sheet state for chat {chat_pk}: {e}")
+            return None
+        
+        if not data.get("url") or not data.get("content_hash"):
+            return None
+        return SheetFetchState(
+            url=data["url"],
+            content_hash=data["content_hash"],
+            etag=data.get("etag") or None,
+            last_modified=data.get("last_modified") or None,
+        )
+    
+    async def put(self, chat_pk: int, state: SheetFetchState) -> None:
+        """Запомнить состояние (вызывать после того, как данные записаны в БД)."""
+        key = self._key(chat_pk)
+        mapping = {name: value or "" for name, value in asdict(state).items()}
+        try:
+            async with redis_client.pipeline(transaction=True) as pipe:
+                pipe.delete(key)
+                pipe.hset(key, mapping=mapping)
+                pipe.expire(key, SHEET_STATE_TTL)
+        except Exception as e:
+            logger.warning(f"Could not save sheet state for chat {chat_pk}: {e}")
+    
+    async def clear(self, chat_pk: int) -> None:
+        try:
+            await redis_client.delete(self._key(chat_pk))
+        except Exception as e:
+            logger.warning(f"Could not clear sheet state for chat {chat_pk}: {e}")
+
+
+# Глобальный инстанс
+sheet_state_cache = SheetStateCache()
@@ -13,3 +13,40 @@ if not BOT_TOKEN:
 if not DATABASE_URL:
     raise ValueError("DATABASE_URL is not set in environment variables")
 
+
+# Write-behind буфер активности участников (middlewares/member_tracker.py)
+MEMBER_FLUSH_INTERVAL = float(os.getenv("MEMBER_FLUSH_INTERVAL", "10"))  # секунды
+MEMBER_FLUSH_MAX_ENTRIES = int(os.getenv("MEMBER_FLUSH_MAX_ENTRIES", "500"))
+
+# Формат записей в кэше участников: compact или json (cache/codecs.py)
+MEMBERS_CACHE_CODEC = os.getenv("MEMBERS_CACHE_CODEC", "compact")
+
+# Процессный кэш чатов (cache/chat_local.py)
+CHAT_CACHE_TTL = float(os.getenv("CHAT_CACHE_TTL", "300"))  # секунды
+CHAT_CACHE_SIZE = int(os.getenv("CHAT_CACHE_SIZE", "1024"))
+
+# Планировщик напоминаний: на сколько секунд вперёд грузить напоминания из БД
+REMINDER_WINDOW_SECONDS = int(os.getenv("REMINDER_WINDOW_SECONDS", "900"))
+# Сколько напоминаний отправлять в Telegram параллельно
+REMINDER_SEND_CONCURRENCY = int(os.getenv("REMINDER_SEND_CONCURRENCY", "20"))
+# Сколько раз пытаться отправить напоминание, прежде чем сдаться
+REMINDER_MAX_ATTEMPTS = int(os.getenv("REMINDER_MAX_ATTEMPTS", "5"))
+
+# Таймеры матдуэлей: объявлять истечение дуэли в чате ровно в срок
+# (иначе дуэли молча завершает scheduler.duels_loop раз в 30 секунд)
+DUEL_EXPIRY_TIMERS = os.getenv("DUEL_EXPIRY_TIMERS", "true").lower() in ("1", "true", "yes")
+
+# Кэш подготовленных фонов шаблонов цитат (services/quote_generator.py), МБ
+QUOTE_BG_CACHE_MB = int(os.getenv("QUOTE_BG_CACHE_MB", "64"))
+# Процессы для рендера цитат (services/quote_renderer.py), 0 — рендер в потоке
+QUOTE_RENDER_WORKERS = int(os.getenv("QUOTE_RENDER_WORKERS", "2"))
+# Сколько недавно использованных шаблонов прогревать в воркерах при старте
+QUOTE_WARM_TEMPLATES = int(os.getenv("QUOTE_WARM_TEMPLATES", "50"))
+
+# Кэш аватарок авторов цитат в assets/avatars: как долго не перепроверять аватарку, секунды
+AVATAR_CACHE_TTL = int(os.getenv("AVATAR_CACHE_TTL", "3600"))
+
+# Общий пул исходящих HTTP-соединений (services/http_client.py)
+HTTP_POOL_LIMIT = int(os.getenv("HTTP_POOL_LIMIT", "100"))
+HTTP_POOL_LIMIT_PER_HOST = int(os.getenv("HTTP_POOL_LIMIT_PER_HOST", "10"))
+HTTP_DNS_CACHE_TTL = int(os.getenv("HTTP_DNS_CACHE_TTL", "300"))  # секунды
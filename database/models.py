@@ -168,6 +168,8 @@ class Reminder(Base):
     created_by_name: Mapped[Optional[str]] = mapped_column(String(255), nullable=True)
     
     is_sent: Mapped[bool] = mapped_column(Boolean, default=False)
+    # Неудачные попытки отправки (после REMINDER_MAX_ATTEMPTS напоминание снимается)
+    send_attempts: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
     created_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True), server_default=func.now()
     )
@@ -285,5 +287,15 @@ class MathDuel(Base):
     
     chat: Mapped["Chat"] = relationship("Chat", back_populates="math_duels")
     
+    # Частичный индекс для поиска истекших дуэлей (scheduler.expire_duels)
+    __table_args__ = (
+        sa.Index(
+            'ix_math_duels_active_expires_at',
+            'expires_at',
+            postgresql_where=sa.text('is_active'),
+            sqlite_where=sa.text('is_active'),
+        ),
+    )
+    
     def __repr__(self) -> str:
         return f"<MathDuel(id={self.id}, challenger={self.challenger_id} vs {self.opponent_id})>"
@@ -1,11 +1,31 @@
 from datetime import datetime
-from typing import Optional, Sequence
+from typing import Awaitable, Callable, Optional, Sequence, Union
 
-from sqlalchemy import select, func, or_, delete
+from sqlalchemy import select, func, or_, delete, insert, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from cache.chat_local import CachedChat, chat_cache
+from cache.duel_index import ActiveDuel, duel_index
+from cache.quote_renders import quote_render_cache
 from .models import Chat, Quote, Activist, Reminder, MutedUser, MathDuel, ChatMember, QuoteTemplate
 
+# Чат, который принимают репозитории: строка из БД или снимок из кэша
+# (используются только id и chat_id)
+ChatRef = Union[Chat, CachedChat]
+
+
+def upsert_insert(session: AsyncSession, model):
+    """
+    INSERT с поддержкой ON CONFLICT ... DO UPDATE для диалекта сессии.
+    
+    В проде это Postgres, SQLite (3.35+) поддерживается для тестов.
+    """
+    if session.bind.dialect.name == "sqlite":
+        return sqlite_insert(model)
+    return pg_insert(model)
+
 
 class ChatRepository:
     """Репозиторий для работы с чатами."""
@@ -13,28 +33,95 @@ class ChatRepository:
     def __init__(self, session: AsyncSession):
         self.session = session
     
-    async def get_or_create(self, chat_id: int, title: Optional[str] = None) -> Chat:
-        """Получить или создать чат по chat_id."""
-        stmt = select(Chat).where(Chat.chat_id == chat_id)
-        result = await self.session.execute(stmt)
+    async def get_or_create(self, chat_id: int, title: Optional[str] = None) -> CachedChat:
+        """
+        Получить или создать чат по chat_id.
+        
+        Возвращает снимок CachedChat (id, chat_id, title, chat_type), а не
+        строку из сессии: при попадании в процессный кэш БД не трогается.
+        Для изменения чата есть set_* методы.
+        """
+        cached = chat_cache.get(chat_id)
+        if cached is not None and (not title or cached.title == title):
+            return cached
+        
+        # INSERT ... ON CONFLICT вместо SELECT + INSERT: без гонки на уникальном
+        # chat_id при параллельных апдейтах из одного чата. Существующая строка
+        # переписывается, только если название действительно поменялось.
+        stmt = self._upsert_statement([{"chat_id": chat_id, "title": title}]).returning(Chat)
+        result = await self.session.execute(
+            select(Chat).from_statement(stmt),
+            execution_options={"populate_existing": True},
+        )
         chat = result.scalar_one_or_none()
+        written = chat is not None
         
         if chat is None:
-            chat = Chat(chat_id=chat_id, title=title)
-            self.session.add(chat)
-            await self.session.commit()
-            await self.session.refresh(chat)
-        elif title and chat.title != title:
-            chat.title = title
-            await self.session.commit()
+            # Строка есть и не изменилась — RETURNING её не вернул
+            result = await self.session.execute(select(Chat).where(Chat.chat_id == chat_id))
+            chat = result.scalar_one()
+        await self.session.commit()
         
-        return chat
+        if written:
+            # Чат создан или переименован — сбрасываем его и в других процессах
+            await chat_cache.invalidate(chat_id)
+        
+        return chat_cache.put(chat)
+    
+    def _upsert_statement(self, rows: list[dict]):
+        """INSERT чатов, который обновляет только изменившиеся названия."""
+        stmt = upsert_insert(self.session, Chat).values(rows)
+        return stmt.on_conflict_do_update(
+            index_elements=[Chat.chat_id],
+            set_={"title": stmt.excluded.title},
+            # Без WHERE каждый вызов писал бы новую версию строки (и WAL)
+            where=stmt.excluded.title.is_not(None) & Chat.title.is_distinct_from(stmt.excluded.title),
+        )
     
-    async def get_by_chat_id(self, chat_id: int) -> Optional[Chat]:
-        """Получить чат по chat_id."""
+    async def upsert_many(self, chats: dict[int, Optional[str]]) -> tuple[dict[int, int], list[int]]:
+        """
+        Создать недостающие чаты и обновить названия одним запросом.
+        
+        Принимает {chat_id: title}, возвращает ({chat_id: chat.id}, chat_id
+        созданных или переименованных чатов). Коммит остаётся за вызывающим
+        кодом — после него записанные чаты нужно сбросить в chat_cache.
+        """
+        if not chats:
+            return {}, []
+        
+        stmt = self._upsert_statement(
+            [{"chat_id": chat_id, "title": title} for chat_id, title in sorted(chats.items())]
+        ).returning(Chat.id, Chat.chat_id)
+        result = await self.session.execute(stmt)
+        chat_pks = {row.chat_id: row.id for row in result}
+        written = list(chat_pks)
+        
+        # Неизменившиеся строки RETURNING не вернул
+        missing = [chat_id for chat_id in chats if chat_id not in chat_pks]
+        if missing:
+            result = await self.session.execute(
+                select(Chat.id, Chat.chat_id).where(Chat.chat_id.in_(missing))
+            )
+            chat_pks.update({row.chat_id: row.id for row in result})
+        return chat_pks, written
+    
+    async def get_by_chat_id(self, chat_id: int) -> Optional[CachedChat]:
+        """
+        Получить чат по chat_id.
+        
+        Возвращает снимок CachedChat (см. get_or_create).
+        """
+        cached = chat_cache.get(chat_id)
+        if cached is not None:
+            return cached
+        
         stmt = select(Chat).where(Chat.chat_id == chat_id)
         result = await self.session.execute(stmt)
-        return result.scalar_one_or_none()
+        chat = result.scalar_one_or_none()
+        
+        if chat is None:
+            return None
+        return chat_cache.put(chat)
     
     async def set_chat_type(self, chat_id: int, chat_type: str) -> Optional[Chat]:
         """Установить тип чата (default, trainer)."""
@@ -46,6 +133,7 @@ class ChatRepository:
             chat.chat_type = chat_type
             await self.session.commit()
             await self.session.refresh(chat)
+            await chat_cache.invalidate(chat_id)
         
         return chat
     
@@ -68,6 +156,7 @@ class ChatRepository:
                 chat.google_sheet_synced_at = datetime.now()
             await self.session.commit()
             await self.session.refresh(chat)
+            await chat_cache.invalidate(chat_id)
         
         return chat
     
@@ -81,6 +170,7 @@ class ChatRepository:
             chat.quote_template_path = path
             await self.session.commit()
             await self.session.refresh(chat)
+            await chat_cache.invalidate(chat_id)
         
         return chat
 
@@ -93,7 +183,7 @@ class QuoteRepository:
     
     async def add(
         self,
-        chat: Chat,
+        chat: ChatRef,
         text: str,
         added_by_id: int,
         added_by_name: Optional[str] = None,
@@ -114,19 +204,31 @@ class QuoteRepository:
         await self.session.refresh(quote)
         return quote
     
-    async def get_random_by_chat(self, chat: Chat) -> Optional[Quote]:
+    async def get_random_by_chat(self, chat: ChatRef) -> Optional[Quote]:
         """Получить случайную цитату из чата."""
         stmt = select(Quote).where(Quote.chat_pk == chat.id).order_by(func.random()).limit(1)
         result = await self.session.execute(stmt)
         return result.scalar_one_or_none()
     
-    async def count_by_chat(self, chat: Chat) -> int:
+    async def count_by_chat(self, chat: ChatRef) -> int:
         """Получить количество цитат в чате."""
         stmt = select(func.count(Quote.id)).where(Quote.chat_pk == chat.id)
         result = await self.session.execute(stmt)
         return result.scalar_one()
 
 
+# Колонки activists, которые заполняются из Google Sheets
+ACTIVIST_SHEET_COLUMNS = (
+    Activist.full_name,
+    Activist.username,
+    Activist.surname,
+    Activist.group_name,
+    Activist.phone,
+    Activist.has_license,
+    Activist.address,
+)
+
+
 class ActivistRepository:
     """Репозиторий для работы с активистами."""
     
@@ -135,7 +237,7 @@ class ActivistRepository:
     
     async def add(
         self,
-        chat: Chat,
+        chat: ChatRef,
         full_name: str,
         username: str,
         surname: Optional[str] = None,
@@ -166,7 +268,7 @@ class ActivistRepository:
         await self.session.refresh(activist)
         return activist
     
-    async def find_by_query(self, chat: Chat, query: str) -> Optional[Activist]:
+    async def find_by_query(self, chat: ChatRef, query: str) -> Optional[Activist]:
         """Найти активиста по фамилии или юзернейму."""
         query_lower = query.lower().strip().lstrip("@")
         stmt = select(Activist).where(
@@ -180,7 +282,7 @@ class ActivistRepository:
         result = await self.session.execute(stmt)
         return result.scalar_one_or_none()
     
-    async def find_by_user_id(self, chat: Chat, user_id: int) -> Optional[Activist]:
+    async def find_by_user_id(self, chat: ChatRef, user_id: int) -> Optional[Activist]:
         """Найти активиста по Telegram user_id."""
         stmt = select(Activist).where(
             Activist.chat_pk == chat.id,
@@ -189,26 +291,95 @@ class ActivistRepository:
         result = await self.session.execute(stmt)
         return result.scalar_one_or_none()
     
-    async def get_random(self, chat: Chat) -> Optional[Activist]:
+    async def get_random(self, chat: ChatRef) -> Optional[Activist]:
         """Получить случайного активиста."""
         stmt = select(Activist).where(Activist.chat_pk == chat.id).order_by(func.random()).limit(1)
         result = await self.session.execute(stmt)
         return result.scalar_one_or_none()
     
-    async def get_all(self, chat: Chat) -> Sequence[Activist]:
+    async def get_all(self, chat: ChatRef) -> Sequence[Activist]:
         """Получить всех активистов чата."""
         stmt = select(Activist).where(Activist.chat_pk == chat.id)
         result = await self.session.execute(stmt)
         return result.scalars().all()
     
-    async def clear_all(self, chat: Chat) -> int:
+    async def get_sheet_rows(self, chat: ChatRef) -> list[dict]:
+        """Текущие активисты чата: id и поля, которые приходят из таблицы."""
+        stmt = select(Activist.id, *ACTIVIST_SHEET_COLUMNS).where(Activist.chat_pk == chat.id)
+        result = await self.session.execute(stmt)
+        return [dict(row._mapping) for row in result]
+    
+    async def apply_diff(
+        self,
+        chat: ChatRef,
+        inserts: Sequence[dict],
+        updates: Sequence[dict],
+        deletes: Sequence[int],
+        on_progress: Optional[Callable[[int, int], Awaitable[None]]] = None,
+        batch_size: int = 1000,
+        commit: bool = True,
+    ) -> None:
+        """
+        Применить изменения из таблицы в одной транзакции.
+        
+        inserts — новые строки (поля Activist без chat_pk), updates — строки
+        с id и изменёнными полями, deletes — id удаляемых активистов.
+        Остальные поля (user_id, info, role) у обновляемых строк не трогаются.
+        on_progress(сделано, всего) вызывается после каждой пачки.
+        commit=False — для потоковой синхронизации, коммитит вызывающий код.
+        """
+        total = len(inserts) + len(updates) + len(deletes)
+        done = 0
+        
+        for i in range(0, len(deletes), batch_size):
+            batch = deletes[i:i + batch_size]
+            await self.session.execute(
+                delete(Activist).where(Activist.chat_pk == chat.id, Activist.id.in_(batch))
+            )
+            done += len(batch)
+            if on_progress is not None:
+                await on_progress(done, total)
+        
+        # Массовый UPDATE по первичному ключу
+        for i in range(0, len(updates), batch_size):
+            batch = updates[i:i + batch_size]
+            await self.session.execute(update(Activist), batch)
+            done += len(batch)
+            if on_progress is not None:
+                await on_progress(done, total)
+        
+        for i in range(0, len(inserts), batch_size):
+            batch = [{**row, "chat_pk": chat.id} for row in inserts[i:i + batch_size]]
+            await self.session.execute(insert(Activist), batch)
+            done += len(batch)
+            if on_progress is not None:
+                await on_progress(done, total)
+        
+        if commit:
+            await self.session.commit()
+    
+    async def update_by_username(self, chat: ChatRef, rows: Sequence[dict]) -> None:
+        """
+        Обновить активистов по username (без учёта регистра), без коммита.
+        
+        Для строк, username которых повторяется в таблице: их id при
+        потоковой синхронизации может быть ещё неизвестен.
+        """
+        for row in rows:
+            await self.session.execute(
+                update(Activist)
+                .where(Activist.chat_pk == chat.id, func.lower(Activist.username) == row["username"].lower())
+                .values(**row)
+            )
+    
+    async def clear_all(self, chat: ChatRef) -> int:
         """Удалить всех активистов чата. Возвращает количество."""
         stmt = delete(Activist).where(Activist.chat_pk == chat.id)
         result = await self.session.execute(stmt)
         await self.session.commit()
         return result.rowcount
     
-    async def count(self, chat: Chat) -> int:
+    async def count(self, chat: ChatRef) -> int:
         """Получить количество активистов в чате."""
         stmt = select(func.count(Activist.id)).where(Activist.chat_pk == chat.id)
         result = await self.session.execute(stmt)
@@ -218,12 +389,15 @@ class ActivistRepository:
 class ReminderRepository:
     """Репозиторий для работы с напоминаниями."""
     
+    # Вызывается после создания напоминания (ставит в очередь, будит планировщик)
+    on_added: Optional[Callable[[Reminder], Awaitable[None]]] = None
+    
     def __init__(self, session: AsyncSession):
         self.session = session
     
     async def add(
         self,
-        chat: Chat,
+        chat: ChatRef,
         remind_at: datetime,
         created_by_id: int,
         created_by_name: Optional[str] = None,
@@ -240,22 +414,71 @@ class ReminderRepository:
         self.session.add(reminder)
         await self.session.commit()
         await self.session.refresh(reminder)
+        
+        if ReminderRepository.on_added is not None:
+            await ReminderRepository.on_added(reminder)
         return reminder
     
-    async def get_pending(self, before: datetime) -> Sequence[Reminder]:
-        """Получить все непосланные напоминания до указанного времени."""
+    async def get_pending_by_ids(self, reminder_ids: list[int]) -> list[tuple[Reminder, int]]:
+        """Получить непосланные напоминания по id вместе с Telegram chat_id."""
+        if not reminder_ids:
+            return []
+        
         stmt = (
-            select(Reminder)
-            .where(Reminder.is_sent == False, Reminder.remind_at <= before)
+            select(Reminder, Chat.chat_id)
+            .join(Chat, Chat.id == Reminder.chat_pk)
+            .where(Reminder.is_sent == False, Reminder.id.in_(reminder_ids))
             .order_by(Reminder.remind_at)
         )
         result = await self.session.execute(stmt)
-        return result.scalars().all()
+        return [(row.Reminder, row.chat_id) for row in result]
+    
+    async def get_pending_schedule(self, before: Optional[datetime] = None) -> list[tuple[datetime, int]]:
+        """
+        Получить (remind_at, id) непосланных напоминаний до указанного
+        времени (или все, если before не задан).
+        """
+        stmt = (
+            select(Reminder.remind_at, Reminder.id)
+            .where(Reminder.is_sent == False)
+            .order_by(Reminder.remind_at)
+        )
+        if before is not None:
+            stmt = stmt.where(Reminder.remind_at <= before)
+        result = await self.session.execute(stmt)
+        return [(row.remind_at, row.id) for row in result]
     
-    async def mark_sent(self, reminder: Reminder) -> None:
-        """Пометить напоминание как отправленное."""
-        reminder.is_sent = True
+    async def mark_sent_many(self, reminder_ids: list[int]) -> int:
+        """Пометить напоминания как отправленные одним UPDATE."""
+        if not reminder_ids:
+            return 0
+        
+        stmt = update(Reminder).where(Reminder.id.in_(reminder_ids)).values(is_sent=True)
+        result = await self.session.execute(stmt)
         await self.session.commit()
+        return result.rowcount
+    
+    async def record_failures(self, reminder_ids: list[int], max_attempts: int) -> list[int]:
+        """
+        Учесть неудачную попытку отправки одним UPDATE.
+        
+        Напоминания, исчерпавшие max_attempts, помечаются отправленными,
+        чтобы больше не возвращаться в очередь. Возвращает их id.
+        """
+        if not reminder_ids:
+            return []
+        
+        attempts = Reminder.send_attempts + 1
+        stmt = (
+            update(Reminder)
+            .where(Reminder.id.in_(reminder_ids))
+            .values(send_attempts=attempts, is_sent=attempts >= max_attempts)
+            .returning(Reminder.id, Reminder.is_sent)
+        )
+        result = await self.session.execute(stmt)
+        given_up = [row.id for row in result if row.is_sent]
+        await self.session.commit()
+        return given_up
 
 
 class MutedUserRepository:
@@ -266,7 +489,7 @@ class MutedUserRepository:
     
     async def add(
         self,
-        chat: Chat,
+        chat: ChatRef,
         user_id: int,
         muted_until: datetime,
         username: Optional[str] = None,
@@ -287,7 +510,7 @@ class MutedUserRepository:
         await self.session.refresh(muted)
         return muted
     
-    async def get_active_mutes(self, chat: Chat) -> Sequence[MutedUser]:
+    async def get_active_mutes(self, chat: ChatRef) -> Sequence[MutedUser]:
         """Получить всех замученных в чате (с активным мутом)."""
         now = datetime.now()
         stmt = select(MutedUser).where(
@@ -297,7 +520,7 @@ class MutedUserRepository:
         result = await self.session.execute(stmt)
         return result.scalars().all()
     
-    async def remove_all(self, chat: Chat) -> int:
+    async def remove_all(self, chat: ChatRef) -> int:
         """Удалить все записи о мутах в чате. Возвращает количество."""
         stmt = delete(MutedUser).where(MutedUser.chat_pk == chat.id)
         result = await self.session.execute(stmt)
@@ -313,57 +536,82 @@ class ChatMemberRepository:
     
     async def add_or_update(
         self,
-        chat: Chat,
+        chat: ChatRef,
         user_id: int,
         full_name: str,
         username: Optional[str] = None,
         first_name: Optional[str] = None,
         last_name: Optional[str] = None,
     ) -> ChatMember:
-        """Добавить или обновить участника чата."""
-        stmt = select(ChatMember).where(
-            ChatMember.chat_pk == chat.id,
-            ChatMember.user_id == user_id
+        """Добавить или обновить участника чата (один INSERT ... ON CONFLICT)."""
+        stmt = upsert_insert(self.session, ChatMember).values(
+            chat_pk=chat.id,
+            user_id=user_id,
+            username=username,
+            full_name=full_name,
+            first_name=first_name,
+            last_name=last_name,
+            message_count=1,
         )
-        result = await self.session.execute(stmt)
-        member = result.scalar_one_or_none()
-        
-        if member is None:
-            member = ChatMember(
-                chat_pk=chat.id,
-                user_id=user_id,
-                username=username,
-                full_name=full_name,
-                first_name=first_name,
-                last_name=last_name,
-                message_count=1,
-            )
-            self.session.add(member)
-        else:
-            # Обновляем данные
-            member.username = username
-            member.full_name = full_name
-            member.first_name = first_name
-            member.last_name = last_name
-            member.message_count += 1
-        
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[ChatMember.chat_pk, ChatMember.user_id],
+            set_={
+                "username": stmt.excluded.username,
+                "full_name": stmt.excluded.full_name,
+                "first_name": stmt.excluded.first_name,
+                "last_name": stmt.excluded.last_name,
+                "message_count": ChatMember.message_count + 1,
+                "last_seen": func.now(),
+            },
+        ).returning(ChatMember)
+        result = await self.session.execute(
+            select(ChatMember).from_statement(stmt),
+            execution_options={"populate_existing": True},
+        )
+        member = result.scalar_one()
         await self.session.commit()
-        await self.session.refresh(member)
         return member
     
-    async def get_all(self, chat: Chat) -> Sequence[ChatMember]:
+    async def bulk_upsert(self, rows: list[dict], batch_size: int = 1000) -> int:
+        """
+        Пакетно добавить/обновить участников.
+        
+        Каждая строка — dict с полями ChatMember, где message_count —
+        прирост счётчика сообщений. Коммит остаётся за вызывающим кодом.
+        """
+        # Стабильный порядок строк — меньше шансов на дедлок между процессами
+        rows = sorted(rows, key=lambda r: (r["chat_pk"], r["user_id"]))
+        
+        for i in range(0, len(rows), batch_size):
+            stmt = upsert_insert(self.session, ChatMember).values(rows[i:i + batch_size])
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[ChatMember.chat_pk, ChatMember.user_id],
+                set_={
+                    "username": stmt.excluded.username,
+                    "full_name": stmt.excluded.full_name,
+                    "first_name": stmt.excluded.first_name,
+                    "last_name": stmt.excluded.last_name,
+                    "message_count": ChatMember.message_count + stmt.excluded.message_count,
+                    "last_seen": func.now(),
+                },
+            )
+            await self.session.execute(stmt)
+        
+        return len(rows)
+    
+    async def get_all(self, chat: ChatRef) -> Sequence[ChatMember]:
         """Получить всех участников чата."""
         stmt = select(ChatMember).where(ChatMember.chat_pk == chat.id)
         result = await self.session.execute(stmt)
         return result.scalars().all()
     
-    async def get_random(self, chat: Chat) -> Optional[ChatMember]:
+    async def get_random(self, chat: ChatRef) -> Optional[ChatMember]:
         """Получить случайного участника чата."""
         stmt = select(ChatMember).where(ChatMember.chat_pk == chat.id).order_by(func.random()).limit(1)
         result = await self.session.execute(stmt)
         return result.scalar_one_or_none()
     
-    async def get_by_user_id(self, chat: Chat, user_id: int) -> Optional[ChatMember]:
+    async def get_by_user_id(self, chat: ChatRef, user_id: int) -> Optional[ChatMember]:
         """Получить участника по user_id."""
         stmt = select(ChatMember).where(
             ChatMember.chat_pk == chat.id,
@@ -372,7 +620,7 @@ class ChatMemberRepository:
         result = await self.session.execute(stmt)
         return result.scalar_one_or_none()
     
-    async def find_by_query(self, chat: Chat, query: str) -> Optional[ChatMember]:
+    async def find_by_query(self, chat: ChatRef, query: str) -> Optional[ChatMember]:
         """Найти участника по имени или юзернейму."""
         query_lower = query.lower().strip().lstrip("@")
         stmt = select(ChatMember).where(
@@ -395,7 +643,7 @@ class MathDuelRepository:
     
     async def create(
         self,
-        chat: Chat,
+        chat: ChatRef,
         challenger_id: int,
         challenger_name: str,
         opponent_id: int,
@@ -418,9 +666,11 @@ class MathDuelRepository:
         self.session.add(duel)
         await self.session.commit()
         await self.session.refresh(duel)
+        
+        duel_index.add(ActiveDuel.from_duel(duel, chat.chat_id))
         return duel
     
-    async def get_active_for_user(self, chat: Chat, user_id: int) -> Optional[MathDuel]:
+    async def get_active_for_user(self, chat: ChatRef, user_id: int) -> Optional[MathDuel]:
         """Получить активную дуэль, где участвует пользователь."""
         now = datetime.now()
         stmt = select(MathDuel).where(
@@ -435,7 +685,7 @@ class MathDuelRepository:
         result = await self.session.execute(stmt)
         return result.scalar_one_or_none()
     
-    async def get_active_in_chat(self, chat: Chat) -> Sequence[MathDuel]:
+    async def get_active_in_chat(self, chat: ChatRef) -> Sequence[MathDuel]:
         """Получить все активные дуэли в чате."""
         now = datetime.now()
         stmt = select(MathDuel).where(
@@ -446,27 +696,120 @@ class MathDuelRepository:
         result = await self.session.execute(stmt)
         return result.scalars().all()
     
-    async def finish_duel(self, duel: MathDuel, winner_id: Optional[int] = None) -> None:
-        """Завершить дуэль."""
-        duel.is_active = False
-        duel.winner_id = winner_id
+    async def resolve(self, duel_id: int, winner_id: int) -> Optional[MathDuel]:
+        """
+        Атомарно завершить дуэль победой winner_id.
+        
+        Один UPDATE ... WHERE is_active RETURNING: из одновременных ответов
+        строку обновит только первый, остальные получат None.
+        """
+        now = datetime.now()
+        stmt = (
+            update(MathDuel)
+            .where(
+                MathDuel.id == duel_id,
+                MathDuel.is_active == True,
+                MathDuel.expires_at > now,
+                or_(
+                    MathDuel.challenger_id == winner_id,
+                    MathDuel.opponent_id == winner_id,
+                ),
+            )
+            .values(is_active=False, winner_id=winner_id)
+            .returning(MathDuel)
+        )
+        result = await self.session.execute(
+            select(MathDuel).from_statement(stmt),
+            execution_options={"populate_existing": True},
+        )
+        duel = result.scalar_one_or_none()
         await self.session.commit()
+        
+        duel_index.remove(duel_id)
+        return duel
     
-    async def expire_old_duels(self) -> int:
-        """Завершить все истекшие дуэли."""
+    async def expire_duel(self, duel_id: int) -> Optional[MathDuel]:
+        """
+        Завершить одну дуэль без победителя, если она ещё активна.
+        
+        Возвращает дуэль, только если её завершил именно этот вызов.
+        """
+        stmt = (
+            update(MathDuel)
+            .where(MathDuel.id == duel_id, MathDuel.is_active == True)
+            .values(is_active=False)
+            .returning(MathDuel)
+        )
+        result = await self.session.execute(
+            select(MathDuel).from_statement(stmt),
+            execution_options={"populate_existing": True},
+        )
+        duel = result.scalar_one_or_none()
+        await self.session.commit()
+        
+        duel_index.remove(duel_id)
+        return duel
+    
+    async def expire_old_duels(self) -> Sequence[tuple[int, int]]:
+        """Завершить все истекшие дуэли одним UPDATE. Возвращает (id, chat_pk)."""
         now = datetime.now()
-        stmt = select(MathDuel).where(
-            MathDuel.is_active == True,
-            MathDuel.expires_at <= now,
+        stmt = (
+            update(MathDuel)
+            .where(MathDuel.is_active == True, MathDuel.expires_at <= now)
+            .values(is_active=False)
+            .returning(MathDuel.id, MathDuel.chat_pk)
         )
         result = await self.session.execute(stmt)
-        duels = result.scalars().all()
+        expired = result.all()
+        await self.session.commit()
         
-        for duel in duels:
-            duel.is_active = False
+        for duel_id, _ in expired:
+            duel_index.remove(duel_id)
+        duel_index.remove_expired()
+        return expired
+    
+    async def get_all_active(self) -> list[ActiveDuel]:
+        """Все активные дуэли с Telegram chat_id (для индекса дуэлей)."""
+        now = datetime.now()
+        stmt = (
+            select(MathDuel, Chat.chat_id)
+            .join(Chat, Chat.id == MathDuel.chat_pk)
+            .where(MathDuel.is_active == True, MathDuel.expires_at > now)
+        )
+        result = await self.session.execute(stmt)
+        return [ActiveDuel.from_duel(duel, chat_id) for duel, chat_id in result]
+    
+    async def find_active(self, chat_id: int, user_id: int) -> Optional[ActiveDuel]:
+        """
+        Активная дуэль пользователя по Telegram chat_id — для промаха индекса.
         
-        await self.session.commit()
-        return len(duels)
+        Дуэль, созданная другой репликой, не попадает в индекс этого процесса;
+        найденная здесь добавляется в индекс. Запрос идёт по частичному индексу
+        активных дуэлей, поэтому дёшев даже на каждое сообщение-число.
+        """
+        now = datetime.now()
+        stmt = (
+            select(MathDuel)
+            .join(Chat, Chat.id == MathDuel.chat_pk)
+            .where(
+                Chat.chat_id == chat_id,
+                MathDuel.is_active == True,
+                MathDuel.expires_at > now,
+                or_(
+                    MathDuel.challenger_id == user_id,
+                    MathDuel.opponent_id == user_id,
+                ),
+            )
+            .limit(1)
+        )
+        result = await self.session.execute(stmt)
+        duel = result.scalar_one_or_none()
+        if duel is None:
+            return None
+        
+        active = ActiveDuel.from_duel(duel, chat_id)
+        duel_index.add(active)
+        return active
 
 
 class QuoteTemplateRepository:
@@ -475,7 +818,7 @@ class QuoteTemplateRepository:
     def __init__(self, session: AsyncSession):
         self.session = session
     
-    async def get_or_create(self, chat: Chat) -> QuoteTemplate:
+    async def get_or_create(self, chat: ChatRef) -> QuoteTemplate:
         """Получить или создать шаблон для чата."""
         stmt = select(QuoteTemplate).where(QuoteTemplate.chat_pk == chat.id)
         result = await self.session.execute(stmt)
@@ -489,12 +832,28 @@ class QuoteTemplateRepository:
         
         return template
     
-    async def get_by_chat(self, chat: Chat) -> Optional[QuoteTemplate]:
+    async def get_by_chat(self, chat: ChatRef) -> Optional[QuoteTemplate]:
         """Получить шаблон для чата."""
         stmt = select(QuoteTemplate).where(QuoteTemplate.chat_pk == chat.id)
         result = await self.session.execute(stmt)
         return result.scalar_one_or_none()
     
+    async def get_recently_used(self, limit: int) -> Sequence[QuoteTemplate]:
+        """Шаблоны чатов, где цитаты добавлялись последними (не больше limit)."""
+        last_quote = (
+            select(Quote.chat_pk, func.max(Quote.created_at).label("last_at"))
+            .group_by(Quote.chat_pk)
+            .subquery()
+        )
+        stmt = (
+            select(QuoteTemplate)
+            .join(last_quote, last_quote.c.chat_pk == QuoteTemplate.chat_pk)
+            .order_by(last_quote.c.last_at.desc())
+            .limit(limit)
+        )
+        result = await self.session.execute(stmt)
+        return result.scalars().all()
+    
     async def update(
         self,
         template: QuoteTemplate,
@@ -507,9 +866,14 @@ class QuoteTemplateRepository:
         
         await self.session.commit()
         await self.session.refresh(template)
+        
+        # Файлы фона/шрифта перезаписываются по тому же пути, поэтому
+        # сбрасываем картинки на любое обновление, а не только на смену полей
+        await quote_render_cache.invalidate(template.chat_pk)
         return template
     
     async def delete(self, template: QuoteTemplate) -> None:
         """Удалить шаблон."""
         await self.session.delete(template)
         await self.session.commit()
+        await quote_render_cache.invalidate(template.chat_pk)
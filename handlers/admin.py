@@ -8,20 +8,28 @@
 - Синхронизация данных
 """
 
+import html
 import logging
 from datetime import datetime
 from typing import Optional
 
 from aiogram import Router, F, Bot
+from aiogram.exceptions import TelegramAPIError, TelegramBadRequest
 from aiogram.filters import Command
 from aiogram.types import Message, CallbackQuery, BufferedInputFile
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.utils.keyboard import InlineKeyboardBuilder
+from sqlalchemy.ext.asyncio import AsyncSession
 
+from cache.chat_members import ChatMembersCache, MembersSummary
+from cache.sheet_state import sheet_state_cache
 from database.engine import async_session
+from database.models import Chat
 from database.repositories import ChatRepository, ActivistRepository
-from services.google_sheets import GoogleSheetsService
+from middlewares.database import db_usage_stats
+from services.google_sheets import GoogleSheetsService, SheetDiffBuilder, SheetStream
+from utils.timezone import to_moscow
 
 logger = logging.getLogger(__name__)
 
@@ -92,6 +100,28 @@ def build_chat_settings_keyboard(chat_id: int, chat_type: str):
     return builder.as_markup()
 
 
+async def get_members_summary(chat_id: int, top_k: int = 3) -> Optional[MembersSummary]:
+    """Сводка по участникам из Redis (None, если кэш недоступен)."""
+    try:
+        return await ChatMembersCache.get_summary(chat_id, top_k=top_k)
+    except Exception as e:
+        logger.warning(f"Could not get members summary for chat {chat_id}: {e}")
+        return None
+
+
+def format_members_summary(summary: Optional[MembersSummary]) -> str:
+    """Текст сводки по участникам для админки."""
+    if summary is None:
+        return "👤 Участники: <i>кэш недоступен</i>"
+    
+    lines = [f"👤 Участников (кэш): {summary.count}"]
+    if summary.last_activity:
+        lines.append(f"🕐 Активность: {to_moscow(summary.last_activity).strftime('%d.%m.%Y %H:%M')}")
+    for member, messages in summary.top:
+        lines.append(f"   • {html.escape(member.full_name)} — {messages}")
+    return "\n".join(lines)
+
+
 def build_back_keyboard(callback_data: str = "admin:menu"):
     """Клавиатура с кнопкой назад."""
     builder = InlineKeyboardBuilder()
@@ -305,6 +335,8 @@ async def cb_chat_view(callback: CallbackQuery):
         
         activists = await activist_repo.get_all(chat)
     
+    members_text = format_members_summary(await get_members_summary(chat.chat_id))
+    
     type_name = "🏋️ Тренерский" if chat.chat_type == "trainer" else "👥 Обычный"
     sheet_status = "✅ Привязана" if chat.google_sheet_url else "❌ Не привязана"
     template_status = "✅ Загружена" if chat.quote_template_path else "❌ Не загружена"
@@ -320,7 +352,8 @@ async def cb_chat_view(callback: CallbackQuery):
         f"🏷 Тип: {type_name}\n"
         f"👥 Активистов: {len(activists)}\n"
         f"📊 Таблица: {sheet_status}{synced_text}\n"
-        f"🖼 Плашка: {template_status}",
+        f"🖼 Плашка: {template_status}\n\n"
+        f"{members_text}",
         parse_mode="HTML",
         reply_markup=build_chat_settings_keyboard(chat_pk, chat.chat_type)
     )
@@ -350,8 +383,8 @@ async def cb_set_chat_type(callback: CallbackQuery):
             await callback.answer("❌ Чат не найден", show_alert=True)
             return
         
-        chat.chat_type = new_type
-        await session.commit()
+        # Через репозиторий, чтобы сбросить кэш чата во всех процессах
+        await ChatRepository(session).set_chat_type(chat.chat_id, new_type)
     
     type_name = "тренерский 🏋️" if new_type == "trainer" else "обычный 👥"
     await callback.answer(f"✅ Тип чата изменён на {type_name}", show_alert=True)
@@ -419,6 +452,56 @@ async def cb_chat_sheet(callback: CallbackQuery, state: FSMContext):
     await callback.answer()
 
 
+async def sync_activists(
+    session: AsyncSession,
+    chat: Chat,
+    stream: SheetStream,
+    status_msg: Message,
+    batch_size: int = 1000,
+) -> Optional[SheetDiffBuilder]:
+    """
+    Применить к активистам чата изменения из таблицы по мере её скачивания.
+    
+    Новые и изменённые строки пишутся пачками в одной открытой транзакции,
+    пока остаток таблицы ещё качается; удаления и повторные username
+    применяются в конце. Коммитит вызывающий код. Если загрузка оборвалась
+    или хэш в конце совпал с прошлым (сервер без ETag/Last-Modified),
+    транзакция откатывается и возвращается None (причина — в stream.error /
+    stream.unchanged). При ответе 304 таблица не читается вовсе.
+    """
+    if stream.error or stream.unchanged:
+        return None
+    
+    async def show(text: str) -> None:
+        try:
+            await status_msg.edit_text(text)
+        except TelegramAPIError:
+            pass  # Прогресс не должен срывать синхронизацию
+    
+    activist_repo = ActivistRepository(session)
+    diff = SheetDiffBuilder(await activist_repo.get_sheet_rows(chat))
+    
+    async def flush() -> None:
+        batch = diff.take_batch()
+        await activist_repo.apply_diff(chat, batch.inserts, batch.updates, [], commit=False)
+    
+    async for activist in stream:
+        diff.add(activist)
+        if diff.pending >= batch_size:
+            await flush()
+            await show(f"⏳ Синхронизация активистов: обработано {stream.parsed}...")
+    
+    if stream.error or stream.unchanged:
+        await session.rollback()
+        return None
+    
+    await flush()
+    deletes, repeated = diff.finish()
+    await activist_repo.apply_diff(chat, [], [], deletes, commit=False)
+    await activist_repo.update_by_username(chat, repeated)
+    return diff
+
+
 @router.message(AdminStates.waiting_sheet_url, F.chat.type == "private")
 async def process_sheet_url(message: Message, state: FSMContext):
     """Обработка URL таблицы."""
@@ -438,61 +521,47 @@ async def process_sheet_url(message: Message, state: FSMContext):
     # Проверяем доступность таблицы
     status_msg = await message.answer("⏳ Проверяю таблицу...")
     
-    activists, error = await GoogleSheetsService.fetch_and_parse(url)
-    
-    if error:
-        await status_msg.edit_text(
-            f"❌ {error}\n\n"
-            "Убедись, что таблица публичная и попробуй снова."
-        )
-        return
-    
-    # Сохраняем URL и импортируем данные
-    async with async_session() as session:
-        from sqlalchemy import select
-        from database.models import Chat
-        
-        stmt = select(Chat).where(Chat.id == chat_pk)
-        result = await session.execute(stmt)
-        chat = result.scalar_one_or_none()
-        
-        if not chat:
-            await status_msg.edit_text("❌ Чат не найден.")
-            await state.clear()
-            return
-        
-        # Сохраняем URL
-        chat.google_sheet_url = url
-        chat.google_sheet_synced_at = datetime.now()
-        
-        # Очищаем старых активистов и добавляем новых
-        activist_repo = ActivistRepository(session)
-        
-        # Удаляем старых
-        from sqlalchemy import delete
-        from database.models import Activist
-        
-        await session.execute(delete(Activist).where(Activist.chat_pk == chat_pk))
-        
-        # Добавляем новых
-        for parsed in activists:
-            await activist_repo.add(
-                chat=chat,
-                full_name=parsed.full_name,
-                username=parsed.username,
-                surname=parsed.surname,
-                group_name=parsed.group_name,
-                phone=parsed.phone,
-                has_license=parsed.has_license,
-                address=parsed.address,
+    # Новая ссылка — всегда полная загрузка
+    async with GoogleSheetsService.open_stream(url, chat_pk, force=True) as stream:
+        if stream.error:
+            await status_msg.edit_text(
+                f"❌ {stream.error}\n\n"
+                "Убедись, что таблица публичная и попробуй снова."
             )
+            return
         
-        await session.commit()
+        # Импортируем данные и сохраняем URL
+        async with async_session() as session:
+            from sqlalchemy import select
+            from database.models import Chat
+            
+            stmt = select(Chat).where(Chat.id == chat_pk)
+            result = await session.execute(stmt)
+            chat = result.scalar_one_or_none()
+            
+            if not chat:
+                await status_msg.edit_text("❌ Чат не найден.")
+                await state.clear()
+                return
+            
+            diff = await sync_activists(session, chat, stream, status_msg)
+            if diff is None:
+                await status_msg.edit_text(
+                    f"❌ {stream.error}\n\n"
+                    "Убедись, что таблица публичная и попробуй снова."
+                )
+                return
+            
+            # URL коммитится вместе с изменениями
+            chat.google_sheet_url = url
+            chat.google_sheet_synced_at = datetime.now()
+            await session.commit()
     
+    await sheet_state_cache.put(chat_pk, stream.state)
     await state.clear()
     await status_msg.edit_text(
         f"✅ <b>Таблица привязана!</b>\n\n"
-        f"Импортировано активистов: <b>{len(activists)}</b>\n\n"
+        f"Активистов: <b>{diff.total}</b> ({diff.summary()})\n\n"
         f"Теперь можно использовать команду <code>!инфа</code> в чате.",
         parse_mode="HTML",
         reply_markup=build_back_keyboard(f"chat:view:{chat_pk}")
@@ -526,42 +595,35 @@ async def cb_sync_chat(callback: CallbackQuery):
         
         await callback.answer("⏳ Синхронизация...")
         
-        # Парсим таблицу
-        activists, error = await GoogleSheetsService.fetch_and_parse(chat.google_sheet_url)
+        # Загружаем таблицу (если она изменилась с прошлой синхронизации)
+        async with GoogleSheetsService.open_stream(chat.google_sheet_url, chat_pk) as stream:
+            diff = await sync_activists(session, chat, stream, callback.message)
         
-        if error:
+        if stream.error:
             await callback.message.edit_text(
-                f"❌ Ошибка синхронизации:\n{error}",
+                f"❌ Ошибка синхронизации:\n{stream.error}",
                 reply_markup=build_back_keyboard(f"chat:view:{chat_pk}")
             )
             return
         
-        # Обновляем данные
-        activist_repo = ActivistRepository(session)
-        
-        from sqlalchemy import delete
-        from database.models import Activist
-        
-        await session.execute(delete(Activist).where(Activist.chat_pk == chat_pk))
-        
-        for parsed in activists:
-            await activist_repo.add(
-                chat=chat,
-                full_name=parsed.full_name,
-                username=parsed.username,
-                surname=parsed.surname,
-                group_name=parsed.group_name,
-                phone=parsed.phone,
-                has_license=parsed.has_license,
-                address=parsed.address,
-            )
-        
+        # Время синхронизации коммитится вместе с изменениями
         chat.google_sheet_synced_at = datetime.now()
         await session.commit()
     
+    await sheet_state_cache.put(chat_pk, stream.state)
+    
+    if diff is None:
+        await callback.message.edit_text(
+            "✅ <b>Таблица не изменилась</b> с прошлой синхронизации.",
+            parse_mode="HTML",
+            reply_markup=build_back_keyboard(f"chat:view:{chat_pk}")
+        )
+        return
+    
     await callback.message.edit_text(
         f"✅ <b>Синхронизация завершена!</b>\n\n"
-        f"Обновлено активистов: <b>{len(activists)}</b>",
+        f"Активистов: <b>{diff.total}</b>\n"
+        f"Изменения: <b>{diff.summary()}</b>",
         parse_mode="HTML",
         reply_markup=build_back_keyboard(f"chat:view:{chat_pk}")
     )
@@ -791,15 +853,27 @@ async def cmd_db_stats(message: Message):
         f"👥 Всего активистов: <b>{activists_count}</b>",
         f"💬 Всего цитат: <b>{quotes_count}</b>",
         f"👤 Всего участников (трекинг): <b>{members_count}</b>",
+        f"⚡️ Апдейтов без БД: <b>{db_usage_stats.updates_without_db}</b> "
+        f"из {db_usage_stats.updates_total} ({db_usage_stats.without_db_ratio:.0%})",
         "\n<b>По чатам:</b>\n"
     ]
     
+    # HLEN по всем чатам одним пайплайном
+    try:
+        cached_counts = await ChatMembersCache.get_member_counts([chat.chat_id for chat, _ in chat_stats])
+    except Exception:
+        cached_counts = {}
+    
     for chat, activist_count in chat_stats:
         type_emoji = "🏋️" if chat.chat_type == "trainer" else "👥"
         title = chat.title or f"ID: {chat.chat_id}"
         if len(title) > 30:
             title = title[:27] + "..."
-        lines.append(f"{type_emoji} {title}: <b>{activist_count}</b> активистов")
+        if chat.chat_id in cached_counts:
+            members_part = f", {cached_counts[chat.chat_id]} в кэше"
+        else:
+            members_part = ""
+        lines.append(f"{type_emoji} {title}: <b>{activist_count}</b> активистов{members_part}")
     
     await message.answer("\n".join(lines), parse_mode="HTML")
 
@@ -6,8 +6,10 @@ from aiogram.types import Message, ChatPermissions
 from aiogram.exceptions import TelegramBadRequest
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from cache.duel_index import ActiveDuel, duel_index
 from database.repositories import ChatRepository, MutedUserRepository, MathDuelRepository
 from filters import BangCommand
+from services.duel_timers import duel_timers
 
 router = Router(name="math_duel")
 router.message.filter(F.chat.type.in_({"group", "supergroup"}))
@@ -105,6 +107,7 @@ async def cmd_math_duel(message: Message, session: AsyncSession, command_args: s
         answer=answer,
         expires_at=expires_at,
     )
+    duel_timers.schedule(ActiveDuel.from_duel(duel, message.chat.id))
     
     await message.answer(
         f"🧮 <b>МАТДУЭЛЬ!</b>\n\n"
@@ -120,17 +123,7 @@ async def cmd_math_duel(message: Message, session: AsyncSession, command_args: s
 @router.message(F.text.regexp(r"^-?\d+$"))
 async def check_math_answer(message: Message, session: AsyncSession):
     """Проверка ответа на математическую дуэль."""
-    chat_repo = ChatRepository(session)
-    duel_repo = MathDuelRepository(session)
-    muted_repo = MutedUserRepository(session)
-    
-    chat = await chat_repo.get_by_chat_id(message.chat.id)
-    if not chat:
-        return
-    
-    # Ищем активную дуэль, где участвует пользователь
-    duel = await duel_repo.get_active_for_user(chat, message.from_user.id)
-    if not duel:
+    if message.from_user is None:
         return
     
     # Проверяем ответ
@@ -139,18 +132,36 @@ async def check_math_answer(message: Message, session: AsyncSession):
     except ValueError:
         return
     
-    if user_answer != duel.answer:
+    chat_repo = ChatRepository(session)
+    duel_repo = MathDuelRepository(session)
+    muted_repo = MutedUserRepository(session)
+    
+    # Сначала индекс в памяти; при промахе — БД (дуэль могла создать другая реплика)
+    indexed = duel_index.get(message.chat.id, message.from_user.id)
+    if indexed is None:
+        indexed = await duel_repo.find_active(message.chat.id, message.from_user.id)
+        if indexed is None:
+            return
+    
+    if user_answer != indexed.answer:
         return  # Неправильный ответ — просто игнорируем
     
-    # Правильный ответ!
+    # Правильный ответ! Завершаем дуэль одним UPDATE: если соперник
+    # ответил одновременно, победителем станет только один из них
     winner_id = message.from_user.id
+    duel = await duel_repo.resolve(indexed.id, winner_id)
+    if not duel:
+        return
+    duel_timers.cancel(duel.id)
+    
+    chat = await chat_repo.get_by_chat_id(message.chat.id)
+    if not chat:
+        return
+    
     loser_id = duel.opponent_id if duel.challenger_id == winner_id else duel.challenger_id
     winner_name = message.from_user.full_name
     loser_name = duel.opponent_name if duel.challenger_id == winner_id else duel.challenger_name
     
-    # Завершаем дуэль
-    await duel_repo.finish_duel(duel, winner_id)
-    
     # Мутим проигравшего
     muted = await mute_user(
         message.bot,
@@ -22,7 +22,8 @@ from aiogram.utils.keyboard import InlineKeyboardBuilder
 from database.engine import async_session
 from database.repositories import ChatRepository, QuoteTemplateRepository
 from database.models import QuoteTemplate
-from services.quote_generator import QuoteImageGenerator, QuoteConfig
+from services.quote_generator import QuoteConfig
+from services.quote_renderer import RenderSpec, quote_renderer
 
 logger = logging.getLogger(__name__)
 
@@ -697,8 +698,9 @@ async def cb_remove_bg(callback: CallbackQuery):
         template_repo = QuoteTemplateRepository(session)
         template = await template_repo.get_or_create(chat)
         
-        if template.background_path and os.path.exists(template.background_path):
-            os.remove(template.background_path)
+        if template.background_path:
+            if os.path.exists(template.background_path):
+                os.remove(template.background_path)
         
         await template_repo.update(template, background_path=None)
     
@@ -826,9 +828,8 @@ async def cb_preview_with_zones(callback: CallbackQuery):
         template = await template_repo.get_or_create(chat)
     
     config = QuoteConfig.from_template(template)
-    generator = QuoteImageGenerator(config)
     
-    image_bytes = generator.generate_preview(show_zones=True)
+    image_bytes = await quote_renderer.render(RenderSpec(config=config, preview=True, show_zones=True))
     photo = BufferedInputFile(image_bytes, filename="preview.png")
     
     # Удаляем старое сообщение и отправляем фото
@@ -863,13 +864,13 @@ async def cb_preview_clean(callback: CallbackQuery):
         template = await template_repo.get_or_create(chat)
     
     config = QuoteConfig.from_template(template)
-    generator = QuoteImageGenerator(config)
     
-    image_bytes = generator.generate(
+    image_bytes = await quote_renderer.render(RenderSpec(
+        config=config,
         quote_text="Пример текста цитаты для проверки шаблона",
         author_name="Имя Автора",
-        quote_id=42
-    )
+        quote_id=42,
+    ))
     photo = BufferedInputFile(image_bytes, filename="preview.png")
     
     # Удаляем старое сообщение и отправляем фото
@@ -927,8 +928,9 @@ async def cb_do_reset(callback: CallbackQuery):
         
         if template:
             # Удаляем файлы
-            if template.background_path and os.path.exists(template.background_path):
-                os.remove(template.background_path)
+            if template.background_path:
+                if os.path.exists(template.background_path):
+                    os.remove(template.background_path)
             if template.font_path and os.path.exists(template.font_path):
                 os.remove(template.font_path)
             
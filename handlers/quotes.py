@@ -1,12 +1,15 @@
 import logging
 
 from aiogram import Router, F
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.types import Message, BufferedInputFile
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from cache.quote_renders import NO_AVATAR, quote_render_cache
 from database.repositories import ChatRepository, QuoteRepository
 from filters import BangCommand
-from services.quote_generator import QuoteImageGenerator
+from services.avatar_cache import avatar_cache
+from services.quote_renderer import RenderSpec, quote_renderer
 
 logger = logging.getLogger(__name__)
 
@@ -19,7 +22,6 @@ async def cmd_add_quote(message: Message, session: AsyncSession, command_args: s
     """!цитата — сохранить цитату и сгенерировать картинку."""
     from database.repositories import QuoteTemplateRepository
     from services.quote_generator import QuoteConfig
-    import io
     
     # Логируем для отладки
     logger.info(f"Quote command from {message.from_user.id}, reply_to_message: {message.reply_to_message is not None}")
@@ -101,35 +103,30 @@ async def cmd_add_quote(message: Message, session: AsyncSession, command_args: s
         else:
             config = QuoteConfig()
         
-        generator = QuoteImageGenerator(config)
-        
-        # Пробуем получить аватарку автора
-        avatar_bytes = None
+        # Аватарка автора (из кэша на диске, если не менялась)
+        avatar = None
         if author_id and config.avatar_enabled:
-            try:
-                photos = await message.bot.get_user_profile_photos(author_id, limit=1)
-                if photos.photos and photos.photos[0]:
-                    photo_file = await message.bot.get_file(photos.photos[0][0].file_id)
-                    avatar_bio = io.BytesIO()
-                    await message.bot.download_file(photo_file.file_path, avatar_bio)
-                    avatar_bytes = avatar_bio.getvalue()
-            except Exception as e:
-                logger.debug(f"Could not get avatar for user {author_id}: {e}")
-        
-        image_bytes = generator.generate(
+            avatar = await avatar_cache.get(message.bot, author_id)
+        
+        image_bytes = await quote_renderer.render(RenderSpec(
+            config=config,
             quote_text=quote_text,
             author_name=author_name,
             quote_id=quote.id,
-            avatar_bytes=avatar_bytes,
-        )
+            avatar_path=str(avatar.path) if avatar else None,
+        ))
         
         # Отправляем картинку
         photo = BufferedInputFile(image_bytes, filename=f"quote_{quote.id}.png")
-        await message.answer_photo(
+        sent = await message.answer_photo(
             photo,
             caption=f"✅ Цитата #{quote.id} сохранена!"
         )
         
+        # Для !мудрость: та же картинка без повторного рендера
+        avatar_key = avatar.file_unique_id if avatar else NO_AVATAR
+        await quote_render_cache.put(chat.id, quote.id, avatar_key, sent.photo[-1].file_id)
+        
     except Exception as e:
         # Fallback — просто текст если генерация не удалась
         logger.error(f"Quote image generation failed: {e}")
@@ -166,32 +163,33 @@ async def cmd_random_quote(message: Message, session: AsyncSession, command_args
         else:
             config = QuoteConfig()
         
-        generator = QuoteImageGenerator(config)
-        
-        # Пробуем получить аватарку автора
-        avatar_bytes = None
+        # Аватарка автора (из кэша на диске, если не менялась)
+        avatar = None
         if quote.author_id and config.avatar_enabled:
+            avatar = await avatar_cache.get(message.bot, quote.author_id)
+        avatar_key = avatar.file_unique_id if avatar else NO_AVATAR
+        
+        # Эта цитата с этим шаблоном и аватаркой уже отправлялась
+        file_id = await quote_render_cache.get(chat.id, quote.id, avatar_key)
+        if file_id:
             try:
-                photos = await message.bot.get_user_profile_photos(quote.author_id, limit=1)
-                if photos.photos and photos.photos[0]:
-                    photo_file = await message.bot.get_file(photos.photos[0][0].file_id)
-                    import io
-                    avatar_bio = io.BytesIO()
-                    await message.bot.download_file(photo_file.file_path, avatar_bio)
-                    avatar_bytes = avatar_bio.getvalue()
-            except Exception as e:
-                logger.debug(f"Could not get avatar for user {quote.author_id}: {e}")
-        
-        image_bytes = generator.generate(
+                await message.answer_photo(file_id)
+                return
+            except TelegramBadRequest as e:
+                logger.debug(f"Cached quote image for #{quote.id} rejected: {e}")
+        
+        image_bytes = await quote_renderer.render(RenderSpec(
+            config=config,
             quote_text=quote.text,
             author_name=quote.author_name,
             quote_id=quote.id,
-            avatar_bytes=avatar_bytes,
-        )
+            avatar_path=str(avatar.path) if avatar else None,
+        ))
         
         # Отправляем как фото
         photo = BufferedInputFile(image_bytes, filename=f"quote_{quote.id}.png")
-        await message.answer_photo(photo)
+        sent = await message.answer_photo(photo)
+        await quote_render_cache.put(chat.id, quote.id, avatar_key, sent.photo[-1].file_id)
         
     except Exception as e:
         # Fallback на текстовый формат если генерация не удалась
@@ -7,11 +7,18 @@ from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
 from aiogram.fsm.storage.memory import MemoryStorage
 
-from config import BOT_TOKEN
+from config import BOT_TOKEN, QUOTE_WARM_TEMPLATES
 from handlers import main_router
 from middlewares import DatabaseMiddleware, MemberTrackerMiddleware
 from scheduler import scheduler_loop
-from cache import redis_client
+from cache import redis_client, chat_cache, duel_index, ChatMembersCache
+from services.member_activity import member_activity_buffer
+from services.duel_timers import duel_timers
+from services.http_client import http_clients
+from services.quote_generator import QuoteConfig
+from services.quote_renderer import quote_renderer
+from database.engine import async_session
+from database.repositories import MathDuelRepository, QuoteTemplateRepository
 
 # Настройка логирования
 logging.basicConfig(
@@ -21,16 +28,67 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Фоновые задачи запуска (держим ссылки, иначе задачу может собрать GC)
+background_tasks: set[asyncio.Task] = set()
+
+
+def _on_background_task_done(task: asyncio.Task) -> None:
+    """Убрать задачу из набора и залогировать её ошибку."""
+    background_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error(f"Background task {task.get_name()} failed", exc_info=task.exception())
+
+
+def _run_in_background(coro, name: str) -> None:
+    """Запустить задачу запуска в фоне, не задерживая старт бота."""
+    task = asyncio.create_task(coro, name=name)
+    background_tasks.add(task)
+    task.add_done_callback(_on_background_task_done)
+
+
+async def warm_quote_renderer() -> None:
+    """Прогреть воркеры рендера недавно использованными шаблонами."""
+    async with async_session() as session:
+        templates = await QuoteTemplateRepository(session).get_recently_used(QUOTE_WARM_TEMPLATES)
+    await quote_renderer.warm(QuoteConfig.from_template(template) for template in templates)
+
 
 async def on_startup(bot: Bot):
     """Действия при запуске бота."""
     logger.info("Connecting to Redis...")
     await redis_client.connect()
     logger.info("Redis connected!")
+    await chat_cache.start()
+    await http_clients.start()
+    # Перекодируем старые записи кэша участников в фоне
+    _run_in_background(ChatMembersCache.migrate_all_encodings(), "members-encoding-migration")
+    await member_activity_buffer.start()
+    
+    # Восстанавливаем индекс активных матдуэлей из БД
+    async with async_session() as session:
+        active_duels = await MathDuelRepository(session).get_all_active()
+    duel_index.load(active_duels)
+    duel_timers.start(bot, active_duels)
+    logger.info(f"Loaded {len(duel_index)} active math duels")
+    
+    # Пул рендера цитат; воркеры прогреваются в фоне
+    await quote_renderer.start()
+    _run_in_background(warm_quote_renderer(), "quote-renderer-warm-up")
 
 
 async def on_shutdown(bot: Bot):
     """Действия при остановке бота."""
+    logger.info("Flushing member activity...")
+    await member_activity_buffer.stop()
+    await duel_timers.stop()
+    await quote_renderer.stop()
+    
+    for task in list(background_tasks):
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    
+    await chat_cache.stop()
+    await http_clients.close()
     logger.info("Disconnecting from Redis...")
     await redis_client.disconnect()
     logger.info("Redis disconnected!")
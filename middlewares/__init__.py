@@ -1,5 +1,5 @@
-from .database import DatabaseMiddleware
+from .database import DatabaseMiddleware, db_usage_stats
 from .member_tracker import MemberTrackerMiddleware
 
-__all__ = ["DatabaseMiddleware", "MemberTrackerMiddleware"]
+__all__ = ["DatabaseMiddleware", "MemberTrackerMiddleware", "db_usage_stats"]
 
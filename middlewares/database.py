@@ -1,10 +1,53 @@
+import logging
+from dataclasses import dataclass
 from typing import Any, Awaitable, Callable, Dict
 
 from aiogram import BaseMiddleware
 from aiogram.types import TelegramObject
+from sqlalchemy import event as sa_event
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from database.engine import async_session
 
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class DatabaseUsageStats:
+    """Сколько апдейтов обработано и сколько из них не трогали БД."""
+    updates_total: int = 0
+    updates_without_db: int = 0
+    
+    @property
+    def without_db_ratio(self) -> float:
+        if not self.updates_total:
+            return 0.0
+        return self.updates_without_db / self.updates_total
+
+
+# Общая статистика для всех инстансов middleware
+db_usage_stats = DatabaseUsageStats()
+
+# Как часто писать статистику в лог (в апдейтах)
+STATS_LOG_EVERY = 1000
+
+
+def _track_usage(session: AsyncSession) -> list[bool]:
+    """
+    Отметить, обращалась ли сессия к БД.
+    
+    AsyncSession и так не берёт соединение до первого запроса, поэтому
+    хендлеры получают настоящую сессию (со всеми async with / begin()),
+    а факт обращения ловим по событию after_begin.
+    """
+    used = [False]
+    
+    def on_begin(*_: Any) -> None:
+        used[0] = True
+    
+    sa_event.listen(session.sync_session, "after_begin", on_begin, once=True)
+    return used
+
 
 class DatabaseMiddleware(BaseMiddleware):
     """Middleware для внедрения сессии БД в хендлеры."""
@@ -16,6 +59,17 @@ class DatabaseMiddleware(BaseMiddleware):
         data: Dict[str, Any],
     ) -> Any:
         async with async_session() as session:
+            used = _track_usage(session)
             data["session"] = session
-            return await handler(event, data)
-
+            try:
+                return await handler(event, data)
+            finally:
+                db_usage_stats.updates_total += 1
+                if not used[0]:
+                    db_usage_stats.updates_without_db += 1
+                
+                if db_usage_stats.updates_total % STATS_LOG_EVERY == 0:
+                    logger.info(
+                        f"DB usage: {db_usage_stats.updates_without_db}/{db_usage_stats.updates_total} "
+                        f"updates served without touching the DB ({db_usage_stats.without_db_ratio:.0%})"
+                    )
@@ -5,8 +5,7 @@ from aiogram import BaseMiddleware
 from aiogram.types import Message
 
 from cache.chat_members import ChatMembersCache
-from database.engine import async_session
-from database.repositories import ChatRepository, ChatMemberRepository
+from services.member_activity import member_activity_buffer
 
 logger = logging.getLogger(__name__)
 
@@ -14,7 +13,8 @@ logger = logging.getLogger(__name__)
 class MemberTrackerMiddleware(BaseMiddleware):
     """
     Middleware для автоматического отслеживания участников чата.
-    Сохраняет каждого кто пишет в Redis кэш и периодически в БД.
+    Сохраняет каждого кто пишет в Redis кэш, а в БД — пачками через
+    write-behind буфер (services.member_activity).
     """
     
     async def __call__(
@@ -45,21 +45,17 @@ class MemberTrackerMiddleware(BaseMiddleware):
                 last_name=user.last_name,
             )
             
-            # Асинхронно сохраняем в БД (в фоне, без блокировки)
-            # Используем отдельную сессию чтобы не блокировать основной хендлер
-            async with async_session() as session:
-                chat_repo = ChatRepository(session)
-                member_repo = ChatMemberRepository(session)
-                
-                chat = await chat_repo.get_or_create(chat_id, event.chat.title)
-                await member_repo.add_or_update(
-                    chat=chat,
-                    user_id=user.id,
-                    username=user.username,
-                    full_name=user.full_name,
-                    first_name=user.first_name,
-                    last_name=user.last_name,
-                )
+            # В БД пишем не сразу: активность копится в буфере и
+            # сбрасывается пачкой раз в несколько секунд
+            member_activity_buffer.add(
+                chat_id=chat_id,
+                chat_title=event.chat.title,
+                user_id=user.id,
+                username=user.username,
+                full_name=user.full_name,
+                first_name=user.first_name,
+                last_name=user.last_name,
+            )
         except Exception as e:
             # Не ломаем бота если трекинг упал
             logger.warning(f"Failed to track member: {e}")
@@ -1,56 +1,107 @@
 import asyncio
+import heapq
 import logging
-from datetime import datetime
+import time
+from datetime import datetime, timedelta
+from typing import Optional
 
 from aiogram import Bot
 
+from cache.delayed_queue import reminder_queue
+from config import REMINDER_WINDOW_SECONDS, REMINDER_SEND_CONCURRENCY, REMINDER_MAX_ATTEMPTS
 from database.engine import async_session
 from database.repositories import ReminderRepository, MathDuelRepository
-from database.models import Chat
+from database.models import Reminder
 from utils.timezone import get_moscow_now, MOSCOW_TZ
 
 logger = logging.getLogger(__name__)
 
+# Сколько напоминаний забирать из очереди за раз
+REMINDER_CLAIM_BATCH = 100
+# Через сколько секунд повторить неудавшуюся отправку
+REMINDER_RETRY_SECONDS = 60
 
-async def check_reminders(bot: Bot):
-    """Проверяет и отправляет напоминания."""
-    async with async_session() as session:
-        reminder_repo = ReminderRepository(session)
-        
-        # Получаем все непосланные напоминания до текущего момента (по МСК)
-        now_moscow = get_moscow_now().replace(tzinfo=MOSCOW_TZ)
-        reminders = await reminder_repo.get_pending(now_moscow)
+
+def _now() -> datetime:
+    """Текущее время по МСК (aware)."""
+    return get_moscow_now().replace(tzinfo=MOSCOW_TZ)
+
+
+async def send_reminder(bot: Bot, reminder: Reminder, chat_id: int) -> bool:
+    """Отправить одно напоминание. Возвращает True при успехе."""
+    text_part = f"\n\n📝 {reminder.text}" if reminder.text else ""
+    message = (
+        f"⏰ <b>НАПОМИНАНИЕ!</b>{text_part}\n\n"
+        f"👤 Создано: {reminder.created_by_name or 'Аноним'}"
+    )
+    
+    try:
+        await bot.send_message(
+            chat_id=chat_id,
+            text=message,
+            parse_mode="HTML"
+        )
+    except Exception as e:
+        logger.error(f"Error sending reminder #{reminder.id}: {e}")
+        return False
+    
+    logger.info(f"Sent reminder #{reminder.id} to chat {chat_id}")
+    return True
+
+
+async def check_reminders(bot: Bot) -> list[tuple[datetime, int]]:
+    """
+    Забирает из очереди наступившие напоминания и отправляет их.
+    
+    Очередь общая для всех реплик бота, claim атомарный — каждое
+    напоминание отправит ровно один процесс. Пока пачка отправляется,
+    claim продлевается. Неудачные отправки повторяются не больше
+    REMINDER_MAX_ATTEMPTS раз. Возвращает (время, id) напоминаний,
+    отложенных на повтор из-за ошибки отправки.
+    """
+    retry: list[tuple[datetime, int]] = []
+    
+    while True:
+        claimed = await reminder_queue.claim_due(time.time(), limit=REMINDER_CLAIM_BATCH)
+        if not claimed:
+            return retry
         
-        for reminder in reminders:
-            try:
-                # Получаем chat_id из связанного чата
-                from sqlalchemy import select
-                from database.models import Chat
-                
-                stmt = select(Chat).where(Chat.id == reminder.chat_pk)
-                result = await session.execute(stmt)
-                chat = result.scalar_one_or_none()
-                
-                if not chat:
-                    continue
-                
-                text_part = f"\n\n📝 {reminder.text}" if reminder.text else ""
-                message = (
-                    f"⏰ <b>НАПОМИНАНИЕ!</b>{text_part}\n\n"
-                    f"👤 Создано: {reminder.created_by_name or 'Аноним'}"
-                )
-                
-                await bot.send_message(
-                    chat_id=chat.chat_id,
-                    text=message,
-                    parse_mode="HTML"
+        async with reminder_queue.keep_claimed(claimed):
+            # Напоминания вместе с chat_id — одним запросом
+            async with async_session() as session:
+                pending = await ReminderRepository(session).get_pending_by_ids([int(i) for i in claimed])
+            
+            # Отправляем параллельно, но не больше REMINDER_SEND_CONCURRENCY за раз
+            semaphore = asyncio.Semaphore(REMINDER_SEND_CONCURRENCY)
+            
+            async def send(reminder: Reminder, chat_id: int) -> bool:
+                async with semaphore:
+                    return await send_reminder(bot, reminder, chat_id)
+            
+            results = await asyncio.gather(*(send(reminder, chat_id) for reminder, chat_id in pending))
+            sent_ids = [reminder.id for (reminder, _), ok in zip(pending, results) if ok]
+            failed_ids = [reminder.id for (reminder, _), ok in zip(pending, results) if not ok]
+            
+            # Помечаем отправленные одним UPDATE
+            if sent_ids:
+                async with async_session() as session:
+                    await ReminderRepository(session).mark_sent_many(sent_ids)
+            
+            if not failed_ids:
+                continue
+            
+            async with async_session() as session:
+                given_up = await ReminderRepository(session).record_failures(failed_ids, REMINDER_MAX_ATTEMPTS)
+            if given_up:
+                logger.warning(
+                    f"Giving up on reminders after {REMINDER_MAX_ATTEMPTS} attempts: {given_up}"
                 )
-                
-                await reminder_repo.mark_sent(reminder)
-                logger.info(f"Sent reminder #{reminder.id} to chat {chat.chat_id}")
-                
-            except Exception as e:
-                logger.error(f"Error sending reminder #{reminder.id}: {e}")
+            
+            # Остальные неотправленные возвращаем в очередь с задержкой
+            retry_at = _now() + timedelta(seconds=REMINDER_RETRY_SECONDS)
+            for reminder_id in set(failed_ids) - set(given_up):
+                await reminder_queue.schedule(reminder_id, retry_at.timestamp())
+                retry.append((retry_at, reminder_id))
 
 
 async def expire_duels():
@@ -59,16 +110,133 @@ async def expire_duels():
         duel_repo = MathDuelRepository(session)
         expired = await duel_repo.expire_old_duels()
         if expired:
-            logger.info(f"Expired {expired} math duels")
+            logger.info(f"Expired {len(expired)} math duels")
 
 
-async def scheduler_loop(bot: Bot):
-    """Основной цикл планировщика."""
-    logger.info("Scheduler started")
+class ReminderScheduler:
+    """
+    Событийный планировщик напоминаний.
+    
+    Держит в min-heap напоминания ближайшего окна (REMINDER_WINDOW_SECONDS)
+    и спит ровно до ближайшего из них. ReminderRepository.add будит его через
+    asyncio.Event, если новое напоминание попадает в загруженное окно.
+    БД опрашивается только при наступлении срока и раз в окно.
+    
+    Heap лишь будит процесс: сами напоминания забираются из общей
+    Redis-очереди (cache.delayed_queue), поэтому реплик может быть несколько.
+    Postgres остаётся источником истины: при старте очередь наполняется
+    из него целиком, а при загрузке окна — дополняется потерянными задачами.
+    """
+    
+    def __init__(self, window_seconds: int = REMINDER_WINDOW_SECONDS):
+        self.window = timedelta(seconds=window_seconds)
+        self._heap: list[tuple[datetime, int]] = []  # (remind_at, reminder.id)
+        self._queued: set[int] = set()
+        self._loaded_until: Optional[datetime] = None
+        self._wakeup = asyncio.Event()
+    
+    def _push(self, remind_at: datetime, reminder_id: int) -> None:
+        if reminder_id in self._queued:
+            return
+        heapq.heappush(self._heap, (remind_at, reminder_id))
+        self._queued.add(reminder_id)
+    
+    async def notify(self, reminder: Reminder) -> None:
+        """Новое напоминание создано в этом процессе."""
+        try:
+            await reminder_queue.schedule(reminder.id, reminder.remind_at.timestamp())
+        except Exception as e:
+            # Попадёт в очередь при загрузке окна
+            logger.warning(f"Could not enqueue reminder #{reminder.id}: {e}")
+        
+        if self._loaded_until is None or reminder.remind_at > self._loaded_until:
+            return  # Подхватится при загрузке следующего окна
+        
+        self._push(reminder.remind_at, reminder.id)
+        self._wakeup.set()
     
+    async def rebuild_queue(self) -> None:
+        """Наполнить Redis-очередь всеми непосланными напоминаниями из БД."""
+        async with async_session() as session:
+            schedule = await ReminderRepository(session).get_pending_schedule()
+        
+        added = await reminder_queue.add_unclaimed(
+            (remind_at.timestamp(), reminder_id) for remind_at, reminder_id in schedule
+        )
+        logger.info(f"Reminder queue rebuilt: {added} of {len(schedule)} pending reminders added")
+    
+    async def _load_window(self) -> None:
+        """Загрузить напоминания до конца следующего окна."""
+        loaded_until = _now() + self.window
+        
+        async with async_session() as session:
+            schedule = await ReminderRepository(session).get_pending_schedule(loaded_until)
+        
+        # Задачи, потерянные упавшей репликой после claim, возвращаются в очередь
+        await reminder_queue.add_unclaimed(
+            (remind_at.timestamp(), reminder_id) for remind_at, reminder_id in schedule
+        )
+        
+        self._loaded_until = loaded_until
+        for remind_at, reminder_id in schedule:
+            self._push(remind_at, reminder_id)
+    
+    async def _tick(self, bot: Bot) -> None:
+        """Один шаг: отправить наступившие или поспать до следующего события."""
+        now = _now()
+        
+        if now >= self._loaded_until:
+            await self._load_window()
+            return
+        
+        if self._heap and self._heap[0][0] <= now:
+            while self._heap and self._heap[0][0] <= now:
+                _, reminder_id = heapq.heappop(self._heap)
+                self._queued.discard(reminder_id)
+            for retry_at, reminder_id in await check_reminders(bot):
+                self._push(retry_at, reminder_id)
+            return
+        
+        next_at = self._loaded_until
+        if self._heap:
+            next_at = min(next_at, self._heap[0][0])
+        
+        self._wakeup.clear()
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), (next_at - now).total_seconds())
+        except asyncio.TimeoutError:
+            pass
+    
+    async def run(self, bot: Bot) -> None:
+        """Основной цикл."""
+        ReminderRepository.on_added = self.notify
+        
+        while True:
+            try:
+                await self.rebuild_queue()
+                break
+            except Exception as e:
+                logger.error(f"Could not rebuild reminder queue: {e}")
+                await asyncio.sleep(5)
+        
+        while True:
+            try:
+                if self._loaded_until is None:
+                    await self._load_window()
+                await self._tick(bot)
+            except Exception as e:
+                logger.error(f"Reminder scheduler error: {e}")
+                await asyncio.sleep(5)
+
+
+# Глобальный инстанс
+reminder_scheduler = ReminderScheduler()
+
+
+async def duels_loop():
+    """Периодически завершает истекшие матдуэли."""
     while True:
         try:
-            await check_reminders(bot)
             await expire_duels()
         except Exception as e:
             logger.error(f"Scheduler error: {e}")
@@ -76,3 +244,12 @@ async def scheduler_loop(bot: Bot):
         # Проверяем каждые 30 секунд
         await asyncio.sleep(30)
 
+
+async def scheduler_loop(bot: Bot):
+    """Основной цикл планировщика."""
+    logger.info("Scheduler started")
+    
+    await asyncio.gather(
+        reminder_scheduler.run(bot),
+        duels_loop(),
+    )
@@ -1,5 +1,42 @@
-from .google_sheets import GoogleSheetsService
-from .quote_generator import QuoteImageGenerator
+"""
+Сервисы бота.
 
-__all__ = ["GoogleSheetsService", "QuoteImageGenerator"]
+Импорты ленивые (PEP 562): воркеры рендера цитат импортируют
+services.quote_renderer и не должны тянуть за собой aiogram, движок БД
+и redis, которые нужны остальным сервисам.
+"""
 
+import importlib
+from typing import Any
+
+# Имя -> модуль, из которого оно экспортируется
+_EXPORTS = {
+    "HttpClients": ".http_client",
+    "http_clients": ".http_client",
+    "GoogleSheetsService": ".google_sheets",
+    "QuoteImageGenerator": ".quote_generator",
+    "MemberActivityBuffer": ".member_activity",
+    "member_activity_buffer": ".member_activity",
+    "DuelExpiryTimers": ".duel_timers",
+    "duel_timers": ".duel_timers",
+    "QuoteRenderService": ".quote_renderer",
+    "RenderSpec": ".quote_renderer",
+    "quote_renderer": ".quote_renderer",
+    "AvatarCache": ".avatar_cache",
+    "avatar_cache": ".avatar_cache",
+}
+
+__all__ = [
+    "GoogleSheetsService", "QuoteImageGenerator", "MemberActivityBuffer", "member_activity_buffer",
+    "DuelExpiryTimers", "duel_timers", "QuoteRenderService", "RenderSpec", "quote_renderer",
+    "AvatarCache", "avatar_cache", "HttpClients", "http_clients",
+]
+
+
+def __getattr__(name: str) -> Any:
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module, __name__), name)
+    globals()[name] = value
+    return value
@@ -0,0 +1,137 @@
+"""
+Кэш аватарок авторов цитат на диске (assets/avatars).
+
+Без кэша каждая картинка цитаты стоила трёх запросов к Telegram
+(get_user_profile_photos, get_file, download_file) и скачивания файла.
+Здесь на пользователя хранится:
+- <user_id>.json — file_unique_id текущей аватарки и время проверки;
+- <user_id>_<file_unique_id>.jpg — сама аватарка;
+- <user_id>_<file_unique_id>_<size>.png — круглые версии
+  (создаёт quote_generator.load_circle_avatar).
+
+В пределах AVATAR_CACHE_TTL аватарка берётся с диска без запросов.
+После TTL делается только get_user_profile_photos: если file_unique_id
+не изменился, файл не скачивается заново.
+"""
+
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+from aiogram import Bot
+
+from config import AVATAR_CACHE_TTL
+from .quote_generator import AVATARS_DIR
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class CachedAvatar:
+    """Аватарка пользователя в кэше."""
+    user_id: int
+    file_unique_id: str
+    path: Path
+
+
+class AvatarCache:
+    """Дисковый кэш аватарок с TTL."""
+    
+    def __init__(self, directory: Path = AVATARS_DIR, ttl: int = AVATAR_CACHE_TTL):
+        self.directory = directory
+        self.ttl = ttl
+    
+    def _meta_path(self, user_id: int) -> Path:
+        return self.directory / f"{user_id}.json"
+    
+    def _avatar_path(self, user_id: int, file_unique_id: str) -> Path:
+        return self.directory / f"{user_id}_{file_unique_id}.jpg"
+    
+    def _read_meta(self, user_id: int) -> Optional[dict]:
+        try:
+            return json.loads(self._meta_path(user_id).read_text())
+        except (OSError, ValueError):
+            return None
+    
+    def _write_meta(self, user_id: int, file_unique_id: Optional[str]) -> None:
+        meta = {"file_unique_id": file_unique_id, "checked_at": time.time()}
+        tmp_path = self._meta_path(user_id).with_suffix(".json.tmp")
+        tmp_path.write_text(json.dumps(meta))
+        os.replace(tmp_path, self._meta_path(user_id))
+    
+    def _cached(self, user_id: int, file_unique_id: Optional[str]) -> Optional[CachedAvatar]:
+        if not file_unique_id:
+            return None
+        path = self._avatar_path(user_id, file_unique_id)
+        if not path.exists():
+            return None
+        return CachedAvatar(user_id=user_id, file_unique_id=file_unique_id, path=path)
+    
+    def _remove_files(self, user_id: int, keep: Optional[str] = None) -> None:
+        """Удалить файлы старых аватарок пользователя."""
+        for path in self.directory.glob(f"{user_id}_*"):
+            if keep and path.name.startswith(f"{user_id}_{keep}"):
+                continue
+            try:
+                path.unlink()
+            except OSError:
+                pass
+    
+    async def get(self, bot: Bot, user_id: int) -> Optional[CachedAvatar]:
+        """Аватарка пользователя (None — аватарки нет или её не получить)."""
+        meta = self._read_meta(user_id)
+        
+        if meta and time.time() - meta["checked_at"] < self.ttl:
+            cached = self._cached(user_id, meta["file_unique_id"])
+            # Без аватарки в прошлый раз — тоже ответ до истечения TTL
+            if cached or not meta["file_unique_id"]:
+                return cached
+        
+        try:
+            photos = await bot.get_user_profile_photos(user_id, limit=1)
+        except Exception as e:
+            logger.debug(f"Could not get avatar for user {user_id}: {e}")
+            # Telegram недоступен — отдаём то, что есть, даже устаревшее
+            return self._cached(user_id, meta["file_unique_id"]) if meta else None
+        
+        if not photos.photos or not photos.photos[0]:
+            self._remove_files(user_id)
+            self._write_meta(user_id, None)
+            return None
+        
+        photo = photos.photos[0][0]
+        cached = self._cached(user_id, photo.file_unique_id)
+        
+        if cached is None:
+            # Аватарка сменилась (или ещё не скачана)
+            path = self._avatar_path(user_id, photo.file_unique_id)
+            tmp_path = path.with_suffix(".jpg.tmp")
+            try:
+                photo_file = await bot.get_file(photo.file_id)
+                await bot.download_file(photo_file.file_path, tmp_path)
+                os.replace(tmp_path, path)
+            except Exception as e:
+                logger.debug(f"Could not download avatar for user {user_id}: {e}")
+                return None
+            
+            self._remove_files(user_id, keep=photo.file_unique_id)
+            cached = CachedAvatar(user_id=user_id, file_unique_id=photo.file_unique_id, path=path)
+        
+        self._write_meta(user_id, photo.file_unique_id)
+        return cached
+    
+    def invalidate(self, user_id: int) -> None:
+        """Забыть аватарку пользователя."""
+        self._remove_files(user_id)
+        try:
+            self._meta_path(user_id).unlink()
+        except OSError:
+            pass
+
+
+# Глобальный инстанс
+avatar_cache = AvatarCache()
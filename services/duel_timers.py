@@ -0,0 +1,90 @@
+"""
+Таймеры истечения матдуэлей.
+
+На каждую активную дуэль заводится asyncio-задача, которая в момент
+expires_at завершает дуэль (условным UPDATE, см. MathDuelRepository.expire_duel)
+и объявляет об этом в чате. scheduler.duels_loop остаётся подстраховкой
+для дуэлей, таймеры которых потерялись при перезапуске.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Iterable, Optional
+
+from aiogram import Bot
+
+from cache.duel_index import ActiveDuel
+from config import DUEL_EXPIRY_TIMERS
+from database.engine import async_session
+from database.repositories import MathDuelRepository
+
+logger = logging.getLogger(__name__)
+
+
+class DuelExpiryTimers:
+    """Таймеры истечения дуэлей по id дуэли."""
+    
+    def __init__(self, enabled: bool = DUEL_EXPIRY_TIMERS):
+        self.enabled = enabled
+        self._bot: Optional[Bot] = None
+        self._timers: dict[int, asyncio.Task] = {}
+    
+    def __len__(self) -> int:
+        return len(self._timers)
+    
+    def schedule(self, duel: ActiveDuel) -> None:
+        """Завести таймер для дуэли."""
+        if not self.enabled or self._bot is None:
+            return
+        
+        self.cancel(duel.id)
+        self._timers[duel.id] = asyncio.create_task(self._expire_at(duel))
+    
+    def cancel(self, duel_id: int) -> None:
+        """Снять таймер (дуэль завершилась раньше срока)."""
+        task = self._timers.pop(duel_id, None)
+        if task is not None and task is not asyncio.current_task():
+            task.cancel()
+    
+    async def _expire_at(self, duel: ActiveDuel) -> None:
+        await asyncio.sleep(max(0.0, duel.expires_at - time.time()))
+        self._timers.pop(duel.id, None)
+        
+        try:
+            async with async_session() as session:
+                expired = await MathDuelRepository(session).expire_duel(duel.id)
+            
+            # None — дуэль уже решена или завершена другим процессом
+            if expired is not None:
+                await self._bot.send_message(
+                    chat_id=duel.chat_id,
+                    text=(
+                        f"⌛ <b>Дуэль истекла!</b>\n\n"
+                        f"{expired.challenger_name} и {expired.opponent_name} так и не решили: "
+                        f"{expired.expression} = <b>{expired.answer}</b>\n\n"
+                        f"Никто не получает мут."
+                    ),
+                    parse_mode="HTML",
+                )
+        except Exception as e:
+            logger.error(f"Error expiring math duel #{duel.id}: {e}")
+    
+    def start(self, bot: Bot, duels: Iterable[ActiveDuel] = ()) -> None:
+        """Включить таймеры и завести их для уже активных дуэлей."""
+        self._bot = bot
+        for duel in duels:
+            self.schedule(duel)
+    
+    async def stop(self) -> None:
+        """Снять все таймеры (дуэли завершит duels_loop после перезапуска)."""
+        tasks = list(self._timers.values())
+        self._timers.clear()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._bot = None
+
+
+# Глобальный инстанс
+duel_timers = DuelExpiryTimers()
@@ -9,15 +9,21 @@
 - Колонка D: Описание/инфо (опционально)
 """
 
+import asyncio
+import codecs
 import csv
-import io
+import hashlib
 import logging
 import re
-from dataclasses import dataclass
-from typing import Optional
+from contextlib import asynccontextmanager
+from dataclasses import asdict, dataclass, field
+from typing import AsyncIterator, Optional
 
 import aiohttp
 
+from cache.sheet_state import SheetFetchState, sheet_state_cache
+from .http_client import http_clients
+
 logger = logging.getLogger(__name__)
 
 
@@ -38,12 +44,220 @@ class ParsedActivist:
     address: Optional[str]  # Адрес
 
 
+@dataclass
+class SheetDiff:
+    """Пачка изменений активистов чата относительно таблицы."""
+    inserts: list[dict] = field(default_factory=list)  # Новые строки
+    updates: list[dict] = field(default_factory=list)  # id + все поля из таблицы
+
+
+class SheetDiffBuilder:
+    """
+    Пошаговое сравнение строк таблицы с активистами из БД по username.
+    
+    Строки таблицы не копятся: новые и изменённые забираются пачками через
+    take_batch(), в памяти остаются только текущие строки из БД и множество
+    встреченных username. Username сравнивается без учёта регистра; если он
+    повторяется в таблице, побеждает последняя строка — такие строки
+    отдаёт finish(), лишние дубли в БД удаляются.
+    """
+    
+    def __init__(self, existing: list[dict]):
+        self._batch = SheetDiff()
+        self._current: dict[str, dict] = {}
+        self._seen: set[str] = set()
+        self._repeated: dict[str, dict] = {}
+        self._deletes: list[int] = []
+        self.inserted = 0
+        self.updated = 0
+        self.deleted = 0
+        self.unchanged = 0
+        
+        for row in existing:
+            key = row["username"].lower()
+            if key in self._current:
+                self._deletes.append(row["id"])
+            else:
+                self._current[key] = row
+    
+    @property
+    def pending(self) -> int:
+        """Сколько строк ждёт записи."""
+        return len(self._batch.inserts) + len(self._batch.updates)
+    
+    @property
+    def total(self) -> int:
+        """Сколько активистов будет после применения."""
+        return self.inserted + self.updated + self.unchanged
+    
+    def summary(self) -> str:
+        return f"+{self.inserted} / ~{self.updated} / -{self.deleted}"
+    
+    def add(self, activist: ParsedActivist) -> None:
+        """Сравнить очередную строку таблицы."""
+        key = activist.username.lower()
+        fields = asdict(activist)
+        
+        if key in self._seen:
+            self._repeated[key] = fields
+            return
+        self._seen.add(key)
+        
+        row = self._current.pop(key, None)
+        if row is None:
+            self._batch.inserts.append(fields)
+            self.inserted += 1
+        elif any(row[name] != value for name, value in fields.items()):
+            self._batch.updates.append({"id": row["id"], **fields})
+            self.updated += 1
+        else:
+            self.unchanged += 1
+    
+    def take_batch(self) -> SheetDiff:
+        """Забрать накопленные вставки и обновления."""
+        batch, self._batch = self._batch, SheetDiff()
+        return batch
+    
+    def finish(self) -> tuple[list[int], list[dict]]:
+        """
+        Завершить сравнение, когда таблица прочитана целиком.
+        
+        Возвращает (id активистов, которых нет в таблице; повторные строки
+        таблицы — их нужно применить по username после всех пачек).
+        """
+        deletes = self._deletes + [row["id"] for row in self._current.values()]
+        self._deletes = []
+        self._current = {}
+        self.deleted = len(deletes)
+        return deletes, list(self._repeated.values())
+
+
+class _CsvRecordBuffer:
+    """
+    Склеивает куски текста в целые CSV-записи.
+    
+    Запись закончена на переводе строки вне кавычек: поле в кавычках может
+    содержать переводы строк, а экранированная кавычка ("") не меняет
+    чётность их числа.
+    """
+    
+    def __init__(self):
+        self._tail = ""
+        self._record: list[str] = []
+        self._quotes = 0
+    
+    def feed(self, text: str) -> list[str]:
+        """Добавить текст, вернуть записи, которые стали полными."""
+        lines = (self._tail + text).split("\n")
+        self._tail = lines.pop()
+        
+        records = []
+        for line in lines:
+            self._record.append(line + "\n")
+            self._quotes += line.count('"')
+            if self._quotes % 2 == 0:
+                records.append("".join(self._record))
+                self._record = []
+                self._quotes = 0
+        return records
+    
+    def flush(self) -> list[str]:
+        """Остаток после конца данных."""
+        rest = "".join(self._record) + self._tail
+        self._tail = ""
+        self._record = []
+        self._quotes = 0
+        return [rest] if rest else []
+
+
+class SheetStream:
+    """
+    Потоковая загрузка таблицы: активисты отдаются по мере скачивания.
+    
+    Открывается через GoogleSheetsService.open_stream. До итерации известны
+    только ответ 304 (unchanged) и ошибка запроса (error). После полного
+    прохода заполняется state, а unchanged выставляется и тогда, когда
+    сервер не поддерживает валидаторы, но хэш содержимого совпал.
+    """
+    
+    CHUNK_SIZE = 64 * 1024
+    
+    def __init__(self, url: str, previous: Optional[SheetFetchState]):
+        self.url = url
+        self.previous = previous
+        self.error: Optional[str] = None
+        self.unchanged = False
+        self.state: Optional[SheetFetchState] = None
+        self.parsed = 0
+        self._response: Optional[aiohttp.ClientResponse] = None
+    
+    async def _rows(self) -> AsyncIterator[list[str]]:
+        """Строки CSV по мере скачивания; в конце считает state."""
+        response = self._response
+        hasher = hashlib.sha256()
+        decoder = codecs.getincrementaldecoder(response.charset or "utf-8")(errors="replace")
+        records = _CsvRecordBuffer()
+        
+        async for chunk in response.content.iter_chunked(self.CHUNK_SIZE):
+            hasher.update(chunk)
+            for row in csv.reader(records.feed(decoder.decode(chunk))):
+                yield row
+        
+        tail = records.feed(decoder.decode(b"", final=True)) + records.flush()
+        for row in csv.reader(tail):
+            yield row
+        
+        self.state = SheetFetchState(
+            url=self.url,
+            content_hash=hasher.hexdigest(),
+            etag=response.headers.get("ETag"),
+            last_modified=response.headers.get("Last-Modified"),
+        )
+        # Сервер не поддерживает валидаторы, но содержимое то же
+        if self.previous is not None and self.state.content_hash == self.previous.content_hash:
+            self.unchanged = True
+    
+    async def __aiter__(self) -> AsyncIterator[ParsedActivist]:
+        if self._response is None:
+            return
+        
+        first = True
+        try:
+            async for row in self._rows():
+                if first:
+                    first = False
+                    if GoogleSheetsService.is_header_row(row):
+                        continue
+                
+                activist = GoogleSheetsService._parse_row(row)
+                if activist:
+                    self.parsed += 1
+                    yield activist
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.error(f"Network error streaming CSV: {e}")
+            self.error = "Не удалось скачать таблицу. Убедитесь, что она публичная."
+            return
+        except csv.Error as e:
+            logger.error(f"Error parsing CSV: {e}")
+            self.error = f"Ошибка парсинга: {str(e)}"
+            return
+        
+        if not self.parsed and not self.unchanged:
+            self.error = "Таблица пуста или имеет неверный формат."
+
+
 class GoogleSheetsService:
     """Сервис для работы с Google Sheets."""
     
     # Паттерн для извлечения ID таблицы из URL
     SHEET_ID_PATTERN = re.compile(r'/spreadsheets/d/([a-zA-Z0-9-_]+)')
     
+    # Шаблон URL экспорта (в тестах можно подменить на локальный сервер)
+    CSV_EXPORT_URL = "https://docs.google.com/spreadsheets/d/{sheet_id}/export?format=csv&gid={gid}"
+    
+    # Для потоковой загрузки ограничиваем простой, а не общее время
+    STREAM_TIMEOUT = aiohttp.ClientTimeout(total=None, sock_connect=30, sock_read=30)
+    
     @classmethod
     def extract_sheet_id(cls, url: str) -> Optional[str]:
         """Извлечь ID таблицы из URL."""
@@ -55,68 +269,24 @@ class GoogleSheetsService:
     @classmethod
     def get_csv_export_url(cls, sheet_id: str, gid: str = "0") -> str:
         """Получить URL для экспорта таблицы в CSV."""
-        return f"https://docs.google.com/spreadsheets/d/{sheet_id}/export?format=csv&gid={gid}"
+        return cls.CSV_EXPORT_URL.format(sheet_id=sheet_id, gid=gid)
     
-    @classmethod
-    async def fetch_csv(cls, url: str) -> Optional[str]:
-        """Скачать CSV контент по URL."""
-        sheet_id = cls.extract_sheet_id(url)
-        if not sheet_id:
-            logger.error(f"Could not extract sheet ID from URL: {url}")
-            return None
-        
-        csv_url = cls.get_csv_export_url(sheet_id)
-        
-        try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(csv_url, timeout=aiohttp.ClientTimeout(total=30)) as response:
-                    if response.status != 200:
-                        logger.error(f"Failed to fetch CSV: HTTP {response.status}")
-                        return None
-                    
-                    content = await response.text()
-                    return content
-        except aiohttp.ClientError as e:
-            logger.error(f"Network error fetching CSV: {e}")
-            return None
-        except Exception as e:
-            logger.error(f"Unexpected error fetching CSV: {e}")
-            return None
+    @staticmethod
+    def _conditional_headers(previous: Optional[SheetFetchState]) -> dict[str, str]:
+        """Заголовки условного запроса по состоянию прошлой загрузки."""
+        headers = {}
+        if previous is not None:
+            if previous.etag:
+                headers["If-None-Match"] = previous.etag
+            if previous.last_modified:
+                headers["If-Modified-Since"] = previous.last_modified
+        return headers
     
-    @classmethod
-    def parse_csv_to_activists(cls, csv_content: str) -> list[ParsedActivist]:
-        """
-        Парсит CSV контент в список активистов.
-        
-        Ожидаемый формат:
-        ФИО | Юзернейм в тг | Группа | Номер телефона | Есть права | Адрес
-        """
-        activists = []
-        
-        reader = csv.reader(io.StringIO(csv_content))
-        
-        # Пропускаем заголовок если есть
-        first_row = next(reader, None)
-        if first_row is None:
-            return activists
-        
-        # Проверяем, является ли первая строка заголовком
-        first_cell = first_row[0].lower().strip() if first_row else ""
-        is_header = any(keyword in first_cell for keyword in ["имя", "фио", "name", "фамилия", "участник"])
-        
-        # Если первая строка не заголовок, обрабатываем её
-        if not is_header:
-            activist = cls._parse_row(first_row)
-            if activist:
-                activists.append(activist)
-        
-        # Обрабатываем остальные строки
-        for row in reader:
-            activist = cls._parse_row(row)
-            if activist:
-                activists.append(activist)
-        
-        return activists
+    @staticmethod
+    def is_header_row(row: list[str]) -> bool:
+        """Является ли строка заголовком таблицы."""
+        first_cell = row[0].lower().strip() if row else ""
+        return any(keyword in first_cell for keyword in ["имя", "фио", "name", "фамилия", "участник"])
     
     @classmethod
     def _parse_row(cls, row: list[str]) -> Optional[ParsedActivist]:
@@ -165,25 +335,58 @@ class GoogleSheetsService:
         )
     
     @classmethod
-    async def fetch_and_parse(cls, url: str) -> tuple[list[ParsedActivist], Optional[str]]:
+    @asynccontextmanager
+    async def open_stream(
+        cls,
+        url: str,
+        chat_pk: int,
+        force: bool = False,
+    ) -> AsyncIterator[SheetStream]:
         """
-        Скачивает и парсит таблицу.
+        Открыть потоковую загрузку таблицы чата.
         
-        Возвращает (список активистов, сообщение об ошибке или None).
+        Шлёт If-None-Match/If-Modified-Since по состоянию последней
+        синхронизации (если не force). Активисты читаются итерацией
+        по SheetStream; после неё stream.state нужно сохранить через
+        sheet_state_cache.put, когда изменения записаны в БД.
         """
-        csv_content = await cls.fetch_csv(url)
+        previous = None if force else await sheet_state_cache.get(chat_pk)
+        if previous is not None and previous.url != url:
+            previous = None
+        
+        stream = SheetStream(url, previous)
         
-        if csv_content is None:
-            return [], "Не удалось скачать таблицу. Убедитесь, что она публичная."
+        sheet_id = cls.extract_sheet_id(url)
+        if not sheet_id:
+            logger.error(f"Could not extract sheet ID from URL: {url}")
+            stream.error = "Не удалось скачать таблицу. Убедитесь, что она публичная."
+            yield stream
+            return
         
         try:
-            activists = cls.parse_csv_to_activists(csv_content)
-            if not activists:
-                return [], "Таблица пуста или имеет неверный формат."
-            return activists, None
-        except Exception as e:
-            logger.error(f"Error parsing CSV: {e}")
-            return [], f"Ошибка парсинга: {str(e)}"
+            response = await http_clients.get().get(
+                cls.get_csv_export_url(sheet_id),
+                headers=cls._conditional_headers(previous),
+                timeout=cls.STREAM_TIMEOUT,
+            )
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.error(f"Network error fetching CSV: {e}")
+            stream.error = "Не удалось скачать таблицу. Убедитесь, что она публичная."
+            yield stream
+            return
+        
+        try:
+            if response.status == 304 and previous is not None:
+                stream.unchanged = True
+                stream.state = previous
+            elif response.status != 200:
+                logger.error(f"Failed to fetch CSV: HTTP {response.status}")
+                stream.error = "Не удалось скачать таблицу. Убедитесь, что она публичная."
+            else:
+                stream._response = response
+            yield stream
+        finally:
+            response.release()
     
     @classmethod
     def validate_url(cls, url: str) -> bool:
@@ -0,0 +1,87 @@
+"""
+Общие aiohttp-сессии для исходящих HTTP-запросов.
+
+Сессия на каждый запрос платит за DNS, TCP и TLS и не переиспользует
+соединения. Здесь сессии живут всё время работы бота: создаются
+в on_startup, закрываются в on_shutdown и делят пул соединений
+с ограничениями и DNS-кэшем.
+
+Сессии именованные: у интеграции со своими заголовками или таймаутами
+может быть отдельная сессия, по умолчанию используется "default".
+"""
+
+import logging
+from typing import Optional
+
+import aiohttp
+
+from config import HTTP_POOL_LIMIT, HTTP_POOL_LIMIT_PER_HOST, HTTP_DNS_CACHE_TTL
+
+logger = logging.getLogger(__name__)
+
+# Таймаут по умолчанию для исходящих запросов
+DEFAULT_TIMEOUT = aiohttp.ClientTimeout(total=30)
+
+
+class HttpClients:
+    """Реестр общих ClientSession с общим пулом соединений."""
+    
+    def __init__(
+        self,
+        limit: int = HTTP_POOL_LIMIT,
+        limit_per_host: int = HTTP_POOL_LIMIT_PER_HOST,
+        dns_cache_ttl: int = HTTP_DNS_CACHE_TTL,
+    ):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.dns_cache_ttl = dns_cache_ttl
+        self._connector: Optional[aiohttp.TCPConnector] = None
+        self._sessions: dict[str, aiohttp.ClientSession] = {}
+    
+    def _get_connector(self) -> aiohttp.TCPConnector:
+        if self._connector is None or self._connector.closed:
+            self._connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                ttl_dns_cache=self.dns_cache_ttl,
+            )
+        return self._connector
+    
+    def get(self, name: str = "default", **session_kwargs) -> aiohttp.ClientSession:
+        """
+        Получить сессию по имени (создаётся при первом обращении).
+        
+        session_kwargs (headers, timeout и т.п.) применяются только при создании.
+        """
+        session = self._sessions.get(name)
+        if session is None or session.closed:
+            session_kwargs.setdefault("timeout", DEFAULT_TIMEOUT)
+            session = aiohttp.ClientSession(
+                connector=self._get_connector(),
+                connector_owner=False,
+                **session_kwargs,
+            )
+            self._sessions[name] = session
+        return session
+    
+    async def start(self) -> None:
+        """Создать сессию по умолчанию и пул соединений."""
+        self.get()
+        logger.info(
+            f"HTTP client pool ready (limit={self.limit}, per host={self.limit_per_host}, "
+            f"DNS cache {self.dns_cache_ttl}s)"
+        )
+    
+    async def close(self) -> None:
+        """Закрыть все сессии и пул соединений."""
+        sessions, self._sessions = self._sessions, {}
+        for session in sessions.values():
+            await session.close()
+        
+        if self._connector is not None:
+            await self._connector.close()
+            self._connector = None
+
+
+# Глобальный инстанс
+http_clients = HttpClients()
@@ -0,0 +1,219 @@
+"""
+Write-behind буфер активности участников чатов.
+
+MemberTrackerMiddleware не ходит в БД на каждое сообщение: активность
+копится в памяти по ключу (chat_id, user_id) и раз в N секунд или при
+накоплении M записей сбрасывается в Postgres одним пакетным upsert.
+
+Если БД недоступна, несброшенная пачка возвращается в буфер, а сброс
+по размеру откладывается с экспоненциальной задержкой, чтобы не долбить
+БД на каждое сообщение. Пока идёт задержка, буфер не растёт больше
+M записей: самые старые отбрасываются.
+"""
+
+import asyncio
+import itertools
+import logging
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from cache.chat_local import chat_cache
+from config import MEMBER_FLUSH_INTERVAL, MEMBER_FLUSH_MAX_ENTRIES
+from database.engine import async_session
+from database.repositories import ChatRepository, ChatMemberRepository
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PendingMember:
+    """Накопленная активность участника между сбросами."""
+    chat_id: int
+    chat_title: Optional[str]
+    user_id: int
+    username: Optional[str]
+    full_name: str
+    first_name: Optional[str]
+    last_name: Optional[str]
+    delta: int = 1
+
+
+class MemberActivityBuffer:
+    """Буфер активности участников с периодическим сбросом в БД."""
+    
+    def __init__(
+        self,
+        flush_interval: float = MEMBER_FLUSH_INTERVAL,
+        max_entries: int = MEMBER_FLUSH_MAX_ENTRIES,
+    ):
+        self.flush_interval = flush_interval
+        self.max_entries = max_entries
+        self._pending: dict[tuple[int, int], PendingMember] = {}
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._size_flush: Optional[asyncio.Task] = None
+        # Подряд неудачных сбросов и когда (time.monotonic) снова можно сбрасывать по размеру
+        self._failures = 0
+        self._size_flush_after = 0.0
+        # Сколько записей отброшено из-за переполнения (пишется в лог при сбросе)
+        self._dropped = 0
+    
+    def __len__(self) -> int:
+        return len(self._pending)
+    
+    def add(
+        self,
+        chat_id: int,
+        chat_title: Optional[str],
+        user_id: int,
+        username: Optional[str],
+        full_name: str,
+        first_name: Optional[str] = None,
+        last_name: Optional[str] = None,
+    ) -> None:
+        """Учесть одно сообщение участника (без обращения к БД)."""
+        key = (chat_id, user_id)
+        entry = self._pending.get(key)
+        
+        if entry is None:
+            if len(self._pending) >= self.max_entries and time.monotonic() < self._size_flush_after:
+                # БД недоступна и сброс отложен — не растём сверх лимита
+                del self._pending[next(iter(self._pending))]
+                self._dropped += 1
+            self._pending[key] = PendingMember(
+                chat_id=chat_id,
+                chat_title=chat_title,
+                user_id=user_id,
+                username=username,
+                full_name=full_name,
+                first_name=first_name,
+                last_name=last_name,
+            )
+        else:
+            # Профиль берём из последнего сообщения, счётчик копим
+            entry.chat_title = chat_title or entry.chat_title
+            entry.username = username
+            entry.full_name = full_name
+            entry.first_name = first_name
+            entry.last_name = last_name
+            entry.delta += 1
+        
+        if (
+            len(self._pending) >= self.max_entries
+            and (self._size_flush is None or self._size_flush.done())
+            and time.monotonic() >= self._size_flush_after
+        ):
+            self._size_flush = asyncio.create_task(self.flush())
+    
+    async def flush(self) -> int:
+        """Сбросить накопленную активность в БД. Возвращает количество строк."""
+        async with self._flush_lock:
+            if not self._pending:
+                return 0
+            
+            # Забираем буфер целиком — новые сообщения копятся в свежий
+            batch, self._pending = self._pending, {}
+            
+            try:
+                async with async_session() as session:
+                    chat_repo = ChatRepository(session)
+                    member_repo = ChatMemberRepository(session)
+                    
+                    titles: dict[int, Optional[str]] = {}
+                    for entry in batch.values():
+                        titles[entry.chat_id] = entry.chat_title or titles.get(entry.chat_id)
+                    chat_pks, written_chats = await chat_repo.upsert_many(titles)
+                    
+                    rows = [
+                        {
+                            "chat_pk": chat_pks[entry.chat_id],
+                            "user_id": entry.user_id,
+                            "username": entry.username,
+                            "full_name": entry.full_name,
+                            "first_name": entry.first_name,
+                            "last_name": entry.last_name,
+                            "message_count": entry.delta,
+                        }
+                        for entry in batch.values()
+                    ]
+                    count = await member_repo.bulk_upsert(rows)
+                    await session.commit()
+            except Exception as e:
+                self._failures += 1
+                backoff = self.flush_interval * min(2 ** (self._failures - 1), 8)
+                self._size_flush_after = time.monotonic() + backoff
+                logger.error(
+                    f"Failed to flush member activity ({len(batch)} entries), "
+                    f"next size-triggered flush in {backoff:.0f}s: {e}"
+                )
+                self._restore(batch)
+                return 0
+            finally:
+                if self._dropped:
+                    logger.warning(f"Member activity buffer overflowed, dropped {self._dropped} entries")
+                    self._dropped = 0
+            
+            self._failures = 0
+            self._size_flush_after = 0.0
+            logger.debug(f"Flushed activity of {count} chat members")
+        
+        # Новые и переименованные чаты — чтобы другие процессы не держали старое название
+        for chat_id in written_chats:
+            await chat_cache.invalidate(chat_id)
+        return count
+    
+    def _restore(self, batch: dict[tuple[int, int], PendingMember]) -> None:
+        """
+        Вернуть несброшенную пачку в буфер, не потеряв счётчики.
+        
+        Буфер ограничен max_entries: лишние записи отбрасываются, начиная
+        с самых старых (пачка старше того, что накопилось во время сброса).
+        """
+        merged: dict[tuple[int, int], PendingMember] = {}
+        for key, entry in batch.items():
+            fresh = self._pending.pop(key, None)
+            if fresh is not None:
+                # Профиль свежий, счётчики складываем
+                fresh.delta += entry.delta
+                entry = fresh
+            merged[key] = entry
+        merged.update(self._pending)
+        
+        overflow = len(merged) - self.max_entries
+        if overflow > 0:
+            for key in list(itertools.islice(merged, overflow)):
+                del merged[key]
+            logger.warning(f"Member activity buffer is full, dropped {overflow} oldest entries")
+        
+        self._pending = merged
+    
+    async def _flush_loop(self) -> None:
+        """Периодический сброс буфера."""
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Member activity flush loop error: {e}")
+    
+    async def start(self) -> None:
+        """Запустить периодический сброс."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush_loop())
+    
+    async def stop(self) -> None:
+        """Остановить периодический сброс и сбросить остатки."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        
+        await self.flush()
+
+
+# Глобальный инстанс
+member_activity_buffer = MemberActivityBuffer()
@@ -9,12 +9,16 @@ import io
 import logging
 import os
 import textwrap
+from collections import OrderedDict
 from dataclasses import dataclass
+from functools import lru_cache
 from pathlib import Path
 from typing import Optional, TYPE_CHECKING
 
 from PIL import Image, ImageDraw, ImageFont, ImageOps
 
+from config import QUOTE_BG_CACHE_MB
+
 if TYPE_CHECKING:
     from database.models import QuoteTemplate
 
@@ -63,6 +67,17 @@ class QuoteConfig:
     # Шрифт
     font_path: Optional[str] = None
     
+    def layer_key(self) -> tuple:
+        """
+        Версия базового слоя: всё, от чего зависит фон шаблона.
+        
+        Первый элемент — путь к фону (None, если файла нет).
+        """
+        mtime_ns = _mtime_ns(self.background_path)
+        if mtime_ns is None:
+            return (None, None, self.background_color, self.image_width, self.image_height)
+        return (self.background_path, mtime_ns, None, self.image_width, self.image_height)
+    
     @classmethod
     def from_template(cls, template: "QuoteTemplate") -> "QuoteConfig":
         """Создать конфиг из модели QuoteTemplate."""
@@ -97,24 +112,195 @@ def hex_to_rgb(hex_color: str) -> tuple[int, int, int]:
     return tuple(int(hex_color[i:i+2], 16) for i in (0, 2, 4))
 
 
+# Во сколько раз больше рисуется круг перед сглаживающим уменьшением
+CIRCLE_MASK_SUPERSAMPLE = 4
+
+
+@lru_cache(maxsize=16)
+def get_circle_mask(size: int) -> Image.Image:
+    """Сглаженная маска круга (кэшируется по размеру, не изменять)."""
+    big = size * CIRCLE_MASK_SUPERSAMPLE
+    mask = Image.new("L", (big, big), 0)
+    draw = ImageDraw.Draw(mask)
+    draw.ellipse((0, 0, big - 1, big - 1), fill=255)
+    return mask.resize((size, size), Image.Resampling.LANCZOS)
+
+
 def make_circle_avatar(image: Image.Image, size: int) -> Image.Image:
     """Сделать круглую аватарку как в Telegram."""
     # Ресайзим до нужного размера
     image = image.resize((size, size), Image.Resampling.LANCZOS)
     
-    # Создаём маску круга
-    mask = Image.new("L", (size, size), 0)
-    draw = ImageDraw.Draw(mask)
-    draw.ellipse((0, 0, size, size), fill=255)
-    
     # Применяем маску
     output = Image.new("RGBA", (size, size), (0, 0, 0, 0))
     output.paste(image, (0, 0))
-    output.putalpha(mask)
+    output.putalpha(get_circle_mask(size))
     
     return output
 
 
+def load_circle_avatar(avatar_path: str, size: int) -> Image.Image:
+    """
+    Круглая аватарка нужного размера из файла кэша аватарок.
+    
+    Результат сохраняется рядом с исходником (<имя>_<size>.png) и при
+    следующих рендерах читается готовым — в том числе другими воркерами.
+    """
+    source = Path(avatar_path)
+    circle_path = source.with_name(f"{source.stem}_{size}.png")
+    
+    if circle_path.exists():
+        with Image.open(circle_path) as cached:
+            return cached.convert("RGBA")
+    
+    with Image.open(source) as image:
+        circle = make_circle_avatar(image, size)
+    
+    # Пишем через временный файл: параллельный воркер не прочитает половину
+    tmp_path = circle_path.with_name(f"{circle_path.name}.{os.getpid()}.tmp")
+    circle.save(tmp_path, format="PNG")
+    os.replace(tmp_path, circle_path)
+    return circle
+
+
+# Системные шрифты с поддержкой кириллицы
+SYSTEM_FONTS = [
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",  # Debian/Ubuntu
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf",
+    "/usr/share/fonts/TTF/DejaVuSans.ttf",  # Arch
+    "/usr/share/fonts/dejavu/DejaVuSans.ttf",  # Fedora
+    "/System/Library/Fonts/Supplemental/Arial Unicode.ttf",  # macOS
+    "/System/Library/Fonts/Helvetica.ttc",
+    "C:\\Windows\\Fonts\\arial.ttf",
+]
+
+# Сколько загруженных шрифтов (путь, размер) держать в памяти
+FONT_CACHE_SIZE = 64
+
+
+@lru_cache(maxsize=1)
+def get_fallback_font_path() -> Optional[str]:
+    """
+    Путь к шрифту по умолчанию: assets/fonts, затем системные шрифты.
+    
+    Ищется один раз за процесс. None — подходящего шрифта нет.
+    """
+    candidates = [str(FONTS_DIR / name) for name in ("main.ttf", "DejaVuSans.ttf")] + SYSTEM_FONTS
+    
+    for font_path in candidates:
+        if os.path.exists(font_path):
+            try:
+                ImageFont.truetype(font_path, 12)
+                return font_path
+            except Exception:
+                continue
+    
+    logger.warning("No TrueType font found, falling back to the default bitmap font")
+    return None
+
+
+@lru_cache(maxsize=FONT_CACHE_SIZE)
+def load_font(font_path: Optional[str], size: int, mtime_ns: int = 0) -> ImageFont.FreeTypeFont:
+    """
+    Загрузить шрифт (кэшируется по пути и размеру на весь процесс).
+    
+    mtime_ns — время изменения файла: перезалитый шрифт чата с тем же
+    путём попадает в кэш под новым ключом.
+    """
+    if font_path is None:
+        return ImageFont.load_default()
+    return ImageFont.truetype(font_path, size)
+
+
+def _mtime_ns(path: Optional[str]) -> Optional[int]:
+    """Время изменения файла (None — файла нет)."""
+    if not path:
+        return None
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+class BaseLayerCache:
+    """
+    LRU кэш базовых слоёв шаблонов.
+    
+    Базовый слой — всё, что не зависит от конкретной цитаты: фон (уже
+    ресайзнутый и в RGBA) или однотонная заливка. generate() начинает
+    с дешёвого copy() готового слоя.
+    
+    Ключ — QuoteConfig.layer_key() (версия шаблона по значимым для слоя
+    полям и mtime файла фона), поэтому перезаписанный файл или смена
+    размера не отдают старую картинку. Явно сбрасывать кэш при замене
+    фона не нужно (да и кэш живёт в процессах рендера, а не в боте).
+    Размер кэша ограничен суммарным объёмом пикселей в байтах.
+    """
+    
+    def __init__(self, max_bytes: int = QUOTE_BG_CACHE_MB * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[tuple, Image.Image] = OrderedDict()
+        self._bytes = 0
+    
+    @staticmethod
+    def _size_of(image: Image.Image) -> int:
+        return image.width * image.height * len(image.getbands())
+    
+    def get(self, config: QuoteConfig) -> Image.Image:
+        """
+        Базовый слой шаблона.
+        
+        Возвращает общий объект из кэша: рисовать нужно на copy().
+        """
+        key = config.layer_key()
+        image = self._entries.get(key)
+        if image is not None:
+            self._entries.move_to_end(key)
+            return image
+        
+        image = self._build(config, has_background=key[0] is not None)
+        
+        # Старые версии этого фона больше не нужны
+        if config.background_path:
+            self.invalidate(config.background_path)
+        self._entries[key] = image
+        self._bytes += self._size_of(image)
+        
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= self._size_of(evicted)
+        return image
+    
+    @staticmethod
+    def _build(config: QuoteConfig, has_background: bool) -> Image.Image:
+        """Собрать базовый слой."""
+        size = (config.image_width, config.image_height)
+        
+        if has_background:
+            try:
+                with Image.open(config.background_path) as source:
+                    return source.resize(size, Image.Resampling.LANCZOS).convert("RGBA")
+            except Exception as e:
+                logger.warning(f"Could not load background: {e}")
+        
+        # Однотонный фон
+        bg_color = hex_to_rgb(config.background_color)
+        return Image.new("RGBA", size, (*bg_color, 255))
+    
+    def invalidate(self, path: str) -> None:
+        """Убрать все слои с этим файлом фона (фон заменён или удалён)."""
+        for key in [key for key in self._entries if key[0] == path]:
+            self._bytes -= self._size_of(self._entries.pop(key))
+    
+    def clear(self) -> None:
+        self._entries.clear()
+        self._bytes = 0
+
+
+# Глобальный инстанс
+base_layer_cache = BaseLayerCache()
+
+
 class QuoteImageGenerator:
     """Генератор изображений с цитатами."""
     
@@ -124,58 +310,18 @@ class QuoteImageGenerator:
     def _get_font(self, size: int) -> ImageFont.FreeTypeFont:
         """Получить шрифт."""
         # Пробуем кастомный шрифт из конфига
-        if self.config.font_path and os.path.exists(self.config.font_path):
+        mtime_ns = _mtime_ns(self.config.font_path)
+        if mtime_ns is not None:
             try:
-                return ImageFont.truetype(self.config.font_path, size)
+                return load_font(self.config.font_path, size, mtime_ns)
             except Exception as e:
                 logger.warning(f"Could not load custom font: {e}")
         
-        # Пробуем шрифт из папки assets
-        for font_name in ["main.ttf", "DejaVuSans.ttf"]:
-            font_path = FONTS_DIR / font_name
-            if font_path.exists():
-                try:
-                    return ImageFont.truetype(str(font_path), size)
-                except Exception:
-                    continue
-        
-        # Системные шрифты с поддержкой кириллицы
-        system_fonts = [
-            "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",  # Debian/Ubuntu
-            "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf",
-            "/usr/share/fonts/TTF/DejaVuSans.ttf",  # Arch
-            "/usr/share/fonts/dejavu/DejaVuSans.ttf",  # Fedora
-            "/System/Library/Fonts/Supplemental/Arial Unicode.ttf",  # macOS
-            "/System/Library/Fonts/Helvetica.ttc",
-            "C:\\Windows\\Fonts\\arial.ttf",
-        ]
-        
-        for font_path in system_fonts:
-            if os.path.exists(font_path):
-                try:
-                    return ImageFont.truetype(font_path, size)
-                except Exception:
-                    continue
-        
-        return ImageFont.load_default()
+        return load_font(get_fallback_font_path(), size)
     
     def _load_background(self) -> Image.Image:
-        """Загрузить или создать фон."""
-        width = self.config.image_width
-        height = self.config.image_height
-        
-        # Пробуем загрузить фоновое изображение
-        if self.config.background_path and os.path.exists(self.config.background_path):
-            try:
-                bg = Image.open(self.config.background_path)
-                bg = bg.resize((width, height), Image.Resampling.LANCZOS)
-                return bg.convert("RGBA")
-            except Exception as e:
-                logger.warning(f"Could not load background: {e}")
-        
-        # Создаём однотонный фон
-        bg_color = hex_to_rgb(self.config.background_color)
-        return Image.new("RGBA", (width, height), (*bg_color, 255))
+        """Копия базового слоя шаблона (фон), на которой можно рисовать."""
+        return base_layer_cache.get(self.config).copy()
     
     def _wrap_text(self, text: str, font: ImageFont.FreeTypeFont, max_width: int) -> list[str]:
         """Разбить текст на строки по ширине."""
@@ -196,6 +342,7 @@ class QuoteImageGenerator:
         author_name: Optional[str] = None,
         quote_id: Optional[int] = None,
         avatar_bytes: Optional[bytes] = None,
+        avatar_path: Optional[str] = None,
     ) -> bytes:
         """
         Сгенерировать изображение с цитатой.
@@ -205,6 +352,7 @@ class QuoteImageGenerator:
             author_name: Имя автора
             quote_id: ID цитаты (для отображения)
             avatar_bytes: Байты аватарки автора
+            avatar_path: Файл аватарки из кэша (вместо avatar_bytes)
         
         Returns:
             bytes: PNG изображение
@@ -253,10 +401,13 @@ class QuoteImageGenerator:
             current_y += line_height
         
         # === АВАТАРКА ===
-        if cfg.avatar_enabled and avatar_bytes:
+        if cfg.avatar_enabled and (avatar_bytes or avatar_path):
             try:
-                avatar_img = Image.open(io.BytesIO(avatar_bytes))
-                circle_avatar = make_circle_avatar(avatar_img, cfg.avatar_size)
+                if avatar_path:
+                    circle_avatar = load_circle_avatar(avatar_path, cfg.avatar_size)
+                else:
+                    avatar_img = Image.open(io.BytesIO(avatar_bytes))
+                    circle_avatar = make_circle_avatar(avatar_img, cfg.avatar_size)
                 
                 # Центрируем аватарку по X
                 avatar_x = cfg.avatar_x - cfg.avatar_size // 2
@@ -0,0 +1,140 @@
+"""
+Рендер цитат в пуле процессов.
+
+QuoteImageGenerator.generate — синхронный код Pillow на сотни миллисекунд
+(вёрстка текста, ресайз, кодирование PNG). Чтобы он не блокировал event
+loop, хендлеры отдают рендер сюда: RenderSpec уходит в ProcessPoolExecutor,
+хендлер ждёт готовые PNG-байты.
+
+Пул поднимается при старте бота, а warm() в фоне отправляет в каждый
+воркер warm_up: spawn запускает воркеры лениво, и так первый рендер
+не платит ни за запуск процесса, ни за загрузку шрифтов и фонов недавно
+использованных шаблонов. Воркер импортирует только этот модуль
+и quote_generator (Pillow) — services/__init__ ничего не тянет сам.
+Если воркер упал (OOM, падение Pillow), пул ломается целиком —
+render() пересоздаёт его и повторяет рендер.
+"""
+
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from typing import Iterable, Optional
+
+from config import QUOTE_RENDER_WORKERS
+from .quote_generator import QuoteConfig, QuoteImageGenerator, base_layer_cache
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class RenderSpec:
+    """Всё, что нужно для рендера (передаётся в воркер через pickle)."""
+    config: QuoteConfig = field(default_factory=QuoteConfig)
+    quote_text: str = ""
+    author_name: Optional[str] = None
+    quote_id: Optional[int] = None
+    avatar_bytes: Optional[bytes] = None
+    avatar_path: Optional[str] = None  # Файл из services.avatar_cache
+    # Превью шаблона вместо цитаты
+    preview: bool = False
+    show_zones: bool = True
+
+
+def render(spec: RenderSpec) -> bytes:
+    """Отрендерить PNG (выполняется в воркере)."""
+    generator = QuoteImageGenerator(spec.config)
+    if spec.preview:
+        return generator.generate_preview(show_zones=spec.show_zones)
+    return generator.generate(
+        quote_text=spec.quote_text,
+        author_name=spec.author_name,
+        quote_id=spec.quote_id,
+        avatar_bytes=spec.avatar_bytes,
+        avatar_path=spec.avatar_path,
+    )
+
+
+def warm_up(configs: Iterable[QuoteConfig]) -> None:
+    """Загрузить шрифты и фоны шаблонов в кэши текущего процесса."""
+    for config in [QuoteConfig(), *configs]:
+        generator = QuoteImageGenerator(config)
+        for size in (config.text_font_size, config.author_font_size, 16):
+            generator._get_font(size)
+        
+        base_layer_cache.get(config)
+
+
+class QuoteRenderService:
+    """Асинхронный фасад над пулом процессов для рендера цитат."""
+    
+    def __init__(self, workers: int = QUOTE_RENDER_WORKERS):
+        self.workers = workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+    
+    def _create_executor(self) -> ProcessPoolExecutor:
+        # spawn: не форкаем процесс с запущенным event loop и соединениями
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    
+    async def start(self) -> None:
+        """Запустить пул (workers=0 — рендер в потоке этого процесса)."""
+        if self.workers <= 0 or self._executor is not None:
+            return
+        
+        self._executor = self._create_executor()
+        logger.info(f"Quote render pool started with {self.workers} workers")
+    
+    async def warm(self, configs: Iterable[QuoteConfig] = ()) -> None:
+        """Прогреть все воркеры шрифтами и фонами шаблонов."""
+        configs = list(configs)
+        executor = self._executor
+        if executor is None:
+            await asyncio.to_thread(warm_up, configs)
+            return
+        
+        # Задачи отправлены разом — spawn запускает по воркеру на каждую
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(
+            loop.run_in_executor(executor, warm_up, configs)
+            for _ in range(self.workers)
+        ))
+        logger.info(f"Quote render workers warmed up with {len(configs)} templates")
+    
+    def _rebuild(self, broken: ProcessPoolExecutor) -> None:
+        """Заменить сломанный пул новым (один раз на сломанный пул)."""
+        if self._executor is not broken:
+            return  # Уже пересоздан параллельным рендером
+        
+        broken.shutdown(wait=False, cancel_futures=True)
+        self._executor = self._create_executor()
+        logger.warning("Quote render pool was broken, started a new one")
+    
+    async def render(self, spec: RenderSpec) -> bytes:
+        """Отрендерить цитату, не блокируя event loop."""
+        executor = self._executor
+        if executor is None:
+            return await asyncio.to_thread(render, spec)
+        
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(executor, render, spec)
+        except BrokenProcessPool:
+            self._rebuild(executor)
+            if self._executor is None:
+                raise  # Сервис остановлен
+            return await loop.run_in_executor(self._executor, render, spec)
+    
+    async def stop(self) -> None:
+        """Остановить пул."""
+        if self._executor is not None:
+            executor, self._executor = self._executor, None
+            await asyncio.to_thread(executor.shutdown, True, cancel_futures=True)
+
+
+# Глобальный инстанс
+quote_renderer = QuoteRenderService()